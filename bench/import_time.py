@@ -0,0 +1,41 @@
+# import_time.py
+"""
+Benchmark the wall time of ``python -c "import coal"``.
+
+Usage::
+
+    python bench/import_time.py [RUNS] [STATEMENT]
+
+Runs the import statement (``import coal`` by default) in a new interpreter
+``RUNS`` times and reports the best, median and worst wall time. The bare
+interpreter start-up time is measured the same way and subtracted.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+
+def measure(code, runs):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for i in xrange(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, "-c", code], cwd=root)
+        times.append(time.time() - start)
+    return sorted(times)
+
+
+def main(argv):
+    runs = int(argv[1]) if len(argv) > 1 else 20
+    code = argv[2] if len(argv) > 2 else "import coal"
+    base = measure("pass", runs)
+    times = measure(code, runs)
+    print "%s (%d runs, interpreter start-up subtracted)" % (code, runs)
+    for label, i in (("best", 0), ("median", runs // 2), ("worst", -1)):
+        print "  %-6s %7.2f ms" % (label, (times[i] - base[i]) * 1000)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
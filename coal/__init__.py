@@ -1,9 +1,63 @@
 # __init__.py
+"""
+Console application library.
 
-import config
+The public classes of the package are imported lazily, on first attribute
+access, so that an application only pays for the modules it actually uses.
+For example, an application that only parses options never imports the file
+operation module or its template engine.
+"""
+
+import importlib
+import sys
+import types
 
-from fileop import FileOp
-from options import Opt, Options
 from path import path
-from shell import Shell, ColorShell
 
+
+_exports = {
+    'completion': ('completion', None),
+    'config'    : ('config', None),
+    'error'     : ('error', None),
+    'fileop'    : ('fileop', None),
+    'minirst'   : ('minirst', None),
+    'options'   : ('options', None),
+    'shell'     : ('shell', None),
+    'util'      : ('util', None),
+    'FileOp'    : ('fileop', 'FileOp'),
+    'LazyCmd'   : ('options', 'LazyCmd'),
+    'Opt'       : ('options', 'Opt'),
+    'Options'   : ('options', 'Options'),
+    'Shell'     : ('shell', 'Shell'),
+    'ColorShell': ('shell', 'ColorShell') }
+
+# ``from coal import *`` imports all the exported names, and thus their modules.
+__all__ = sorted(_exports) + ['path']
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Package module that imports the exported names on first access.
+
+    The original package module is kept alive in ``_module`` as Python clears
+    the globals of a module when the module object is released.
+    """
+    def __getattr__(self, name):
+        try:
+            modname, attr = _exports[name]
+        except KeyError:
+            raise AttributeError("module '%s' has no attribute '%s'" %
+                                 (self.__name__, name))
+        module = importlib.import_module('%s.%s' % (self.__name__, modname))
+        value = module if attr is None else getattr(module, attr)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_exports))
+
+
+_lazy = _LazyModule(__name__, __doc__)
+_lazy.__dict__.update(globals())
+_lazy._module = sys.modules[__name__]
+sys.modules[__name__] = _lazy
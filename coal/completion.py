@@ -0,0 +1,229 @@
+# completion.py
+"""
+Shell completion for ``Options`` based command line applications.
+
+Completion is split into two steps so that pressing TAB never imports the
+application itself:
+
+  1. At build or install time ``write_completion`` walks the ``Options`` class
+     tree once and writes a static completion index (a JSON file) along with
+     completion scripts for bash, zsh and fish.
+
+  2. At completion time the shell script runs ``python -m coal.completion
+     complete INDEX -- WORDS...`` which answers from the index alone.
+
+The index maps each command path (the canonical names of the sub-commands
+separated by spaces, the root command being the empty string) to a node with
+the sub-command aliases valid at that point and the options accepted there,
+including those inherited from the parent commands. For each option the index
+records whether it takes an argument and the valid values of enumerated
+options.
+"""
+
+import json
+import os
+import pipes
+import sys
+
+
+_scripts = {
+    'bash': """\
+# bash completion for %(prog)s
+_coal_complete_%(func)s() {
+    local IFS=$'\\n'
+    COMPREPLY=( $(%(python)s -m coal.completion complete %(index)s -- \\
+                  "${COMP_WORDS[@]:1:COMP_CWORD}") )
+    # '=' breaks words, so only the text after it is being completed.
+    if [[ ${COMP_WORDS[COMP_CWORD]} == = ||
+          ${COMP_WORDS[COMP_CWORD-1]} == = ]]; then
+        COMPREPLY=( "${COMPREPLY[@]#*=}" )
+    fi
+}
+complete -o default -F _coal_complete_%(func)s %(prog)s
+""",
+    'zsh': """\
+#compdef %(prog)s
+# zsh completion for %(prog)s
+_coal_complete_%(func)s() {
+    local -a completions
+    completions=("${(@f)$(%(python)s -m coal.completion complete %(index)s -- \\
+                  "${(@)words[2,CURRENT]}")}")
+    compadd -a completions
+}
+compdef _coal_complete_%(func)s %(prog)s
+""",
+    'fish': """\
+# fish completion for %(prog)s
+complete -c %(prog)s -f -a '(%(fish_python)s -m coal.completion complete %(fish_index)s -- \\
+    (commandline -opc)[2..-1] (commandline -ct))'
+""" }
+
+
+def build_index(cls):
+    """
+    Walk the ``Options`` class tree and return the completion index.
+
+    Sub-commands specified lazily are loaded in order to read their options.
+    A sub-command class that appears again within its own chain is indexed
+    only once to guard against cyclic command tables.
+    """
+    from coal.options import LazyCmd, _CmdIndex
+
+    index = {}
+    def walk(cls, key, inherited, seen):
+        options = dict(inherited)
+        for opt in cls._opttable().handlers:
+            entry = {'arg': opt.arg_required, 'values': opt.choices or []}
+            options['--%s' % opt.long_opt] = entry
+            if opt.short_opt:
+                options['-%s' % opt.short_opt] = entry
+        node = index[key] = {'options': options, 'commands': {}}
+
+        cmds = _CmdIndex(getattr(cls, 'cmds', {}))
+        for name, cmd in cmds.entries.iteritems():
+            aliases = name.split('|')
+            child = ('%s %s' % (key, aliases[0])).strip()
+            for alias in aliases:
+                node['commands'][alias] = child
+            if isinstance(cmd, LazyCmd):
+                cmd = cmd.load()
+            if cmd not in seen:
+                walk(cmd, child, options, seen + (cmd,))
+
+    walk(cls, '', {}, (cls,))
+    return index
+
+
+def save_index(index, fname):
+    with open(fname, 'w') as f:
+        json.dump(index, f, sort_keys=True, separators=(',', ':'))
+
+
+def load_index(fname):
+    with open(fname, 'r') as f:
+        return json.load(f)
+
+
+def _long_option(node, name):
+    """ Look up a long option by name or unique prefix. """
+    options = node['options']
+    if name in options:
+        return options[name]
+    matches = [o for o in options if o.startswith(name) and o[:2] == '--']
+    if len(matches) == 1:
+        return options[matches[0]]
+    return None
+
+
+def _join_values(words):
+    """
+    Join ``--option = value`` words back into ``--option=value``, as bash
+    splits words at '=' characters.
+    """
+    joined = []
+    glue = False
+    for word in words:
+        if (word == '=' and joined and joined[-1][:2] == '--' and
+                '=' not in joined[-1]):
+            joined[-1] += word
+            glue = True
+        elif glue:
+            joined[-1] += word
+            glue = False
+        else:
+            joined.append(word)
+    return joined
+
+
+def complete(index, words):
+    """
+    Return the completions of the last word of a command line.
+
+    The ``words`` are the command line words following the program name; the
+    last word is the (possibly empty) word being completed. The preceding
+    words are walked to find the current sub-command and whether the word
+    being completed is the argument of an option.
+    """
+    words = _join_values(words) or ['']
+    node = index['']
+    expect = None
+    for word in words[:-1]:
+        if expect is not None:
+            expect = None
+        elif word[:2] == '--':
+            opt = _long_option(node, word.split('=', 1)[0])
+            if opt and opt['arg'] and '=' not in word:
+                expect = opt
+        elif word[:1] == '-' and word != '-':
+            for i in xrange(1, len(word)):
+                opt = node['options'].get('-%s' % word[i])
+                if opt and opt['arg']:
+                    if i == len(word) - 1:
+                        expect = opt
+                    break
+        elif word in node['commands']:
+            node = index[node['commands'][word]]
+
+    cur = words[-1]
+    if expect is not None:
+        return [v for v in expect['values'] if v.startswith(cur)]
+    if cur[:2] == '--' and '=' in cur:
+        name, value = cur.split('=', 1)
+        opt = _long_option(node, name)
+        values = opt and opt['values'] or []
+        return ['%s=%s' % (name, v) for v in values if v.startswith(value)]
+    if cur[:1] == '-':
+        return sorted(o for o in node['options'] if o.startswith(cur))
+    return sorted(c for c in node['commands'] if c.startswith(cur))
+
+
+def script(shell, prog, index_file, python=None):
+    """ Return the completion script of ``prog`` for the given shell. """
+    python = pipes.quote(python or sys.executable)
+    index = pipes.quote(os.path.abspath(index_file))
+    # The fish command is itself within a single quoted string.
+    fish = lambda s: s.replace('\\', '\\\\').replace("'", "\\'")
+    return _scripts[shell] % {
+        'prog': prog,
+        'func': ''.join(c if c.isalnum() else '_' for c in prog),
+        'python': python,
+        'index': index,
+        'fish_python': fish(python),
+        'fish_index': fish(index) }
+
+
+def write_completion(cls, prog, directory, python=None):
+    """
+    Write the completion index and scripts of an application.
+
+    The index is written to ``PROG.json`` and the scripts to ``PROG.bash``,
+    ``PROG.zsh`` and ``PROG.fish`` in ``directory``. Returns the list of
+    written files.
+    """
+    index_file = os.path.join(directory, '%s.json' % prog)
+    save_index(build_index(cls), index_file)
+    files = [index_file]
+    for shell in sorted(_scripts):
+        fname = os.path.join(directory, '%s.%s' % (prog, shell))
+        with open(fname, 'w') as f:
+            f.write(script(shell, prog, index_file, python))
+        files.append(fname)
+    return files
+
+
+def main(argv):
+    """ Command line entry: ``complete INDEX [--] WORDS...`` """
+    if len(argv) < 2 or argv[0] != 'complete':
+        sys.stderr.write('usage: python -m coal.completion complete INDEX '
+                         '-- WORDS...\n')
+        return 2
+    words = argv[2:]
+    if words[:1] == ['--']:
+        words = words[1:]
+    for completion in complete(load_index(argv[1]), words):
+        sys.stdout.write('%s\n' % completion)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -1,13 +1,72 @@
 # config.py
 
 
+import errno
+import marshal
+import os
+import re
+import select
+import struct
+import sys
+import time
+import weakref
+
+from error import ConfigParseError, ConfigValueError
 from path import path
 
 
-try:
-    from configparser import RawConfigParser
-except ImportError as e:
-    from ConfigParser import RawConfigParser
+_section_re = re.compile(r"\[(?P<header>[^]]+)\]")
+_option_re = re.compile(r"(?P<key>[^:=]+?)\s*[:=]\s*(?P<value>.*)$")
+
+
+_missing = object()
+
+_bool_values = {'1': True, 'yes': True, 'true': True, 'on': True,
+                '0': False, 'no': False, 'false': False, 'off': False}
+_list_sep_re = re.compile(r"[\s,]+")
+
+# Header of configuration snapshot files. Marshal data is only readable by the
+# Python version that wrote it, so the version is part of the header.
+_snapshot_magic = ('coal-config-snapshot', 1) + tuple(sys.version_info[:2])
+
+
+def snapshot_name(fname):
+    """ Return the name of the snapshot file of a configuration file. """
+    head, tail = os.path.split(fname)
+    return os.path.join(head, '.%s.snapshot' % tail)
+
+
+def _load_snapshot(fname, stamp):
+    """
+    Load the data of a snapshot file if it was taken of a configuration file
+    with the given stamp. Returns ``None`` if the snapshot is missing, stale or
+    can not be read.
+    """
+    try:
+        with open(fname, 'rb') as f:
+            magic, stamp_, data = marshal.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+    if magic != _snapshot_magic or stamp_ != stamp:
+        return None
+    return data
+
+
+def _save_snapshot(fname, stamp, data):
+    """
+    Atomically write a snapshot file. Failures are ignored since the snapshot
+    is only a cache.
+    """
+    tmp = '%s.%d' % (fname, os.getpid())
+    try:
+        with open(tmp, 'wb') as f:
+            marshal.dump((_snapshot_magic, stamp, data), f)
+        os.rename(tmp, fname)
+    except (IOError, OSError, ValueError):
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
 
 
 class ConfigStore(object):
@@ -24,11 +83,15 @@ class ConfigStore(object):
     which represents where the configuration value was read from or set by. This
     is particularly important when a configuration field reprsents things such
     as paths as the source may be used to interpret the value as a relative
-    path.
+    path. Sources are interned per store: a source is only made absolute and
+    stored once no matter how many values it sets.
     """
     def __init__(self, src=None):
         self._data = {}
         self._source = {}
+        self._sources = {}
+        self._version = 0
+        self._chains = weakref.WeakKeyDictionary()
         if src:
             self._source = src._source.copy()
             for section in src._data:
@@ -53,13 +116,49 @@ class ConfigStore(object):
         """ Get the source identifier of a configuration value. """
         return self._source.get((section, key), None)
 
+    def _intern(self, source):
+        """ Return the interned absolute path of a source. """
+        if not source:
+            return None
+        source_ = self._sources.get(source)
+        if source_ is None:
+            source_ = path(source).abspath()
+            source_ = self._sources.setdefault(source_, source_)
+            # Relative sources depend on the current directory so only
+            # absolute ones are cached as given.
+            if os.path.isabs(source):
+                self._sources[source] = source_
+        return source_
+
     def set(self, section, key, value, source=None):
         """ Add a configuration field to the data store. """
-        source = source and path(source).abspath() or None
         if section not in self._data:
             self._data[section] = {}
         self._data[section][key] = value
-        self._source[(section, key)] = source
+        self._source[(section, key)] = self._intern(source)
+        self._changed()
+
+    def _changed(self):
+        """ Bump the version of the store and of the chains containing it. """
+        self._version += 1
+        for chain in self._chains.keys():
+            chain._changed()
+
+    def update_section(self, section, items, source=None):
+        """
+        Add all key/value pairs of a dictionary to a section at once.
+
+        This is the bulk-load counterpart of ``set``: the source is looked up
+        only once for all the values.
+        """
+        source = self._intern(source)
+        data = self._data.get(section)
+        if data is None:
+            self._data[section] = dict(items)
+        else:
+            data.update(items)
+        self._source.update(((section, key), source) for key in items)
+        self._changed()
 
     def unset(self, section, key):
         """ Remove a configuration field from the data store. """
@@ -68,6 +167,7 @@ class ConfigStore(object):
             del self._data[section][key]
         if (section, key) in self._source:
             del self._source[(section, key)]
+        self._changed()
 
     def update(self, src):
         """ Update this data store with the data form another. """
@@ -76,6 +176,7 @@ class ConfigStore(object):
                 self._data[section] = {}
             self._data[section].update(src._data[section])
         self._source.update(src._source)
+        self._changed()
 
     def sections(self):
         return self._data.keys()
@@ -85,6 +186,151 @@ class ConfigStore(object):
             yield key, value
 
 
+class ChainConfigStore(ConfigStore):
+    """
+    A layered view over several configuration data stores.
+
+    The layers are given in order of increasing priority: a value is looked up
+    in the last (top) layer first and then in each layer below it. Layers can be
+    pushed and popped at the top in constant time, so a configuration can be
+    overridden without copying the stores underneath it. Changes (``set``,
+    ``unset``, ``update`` and ``update_section``) and file reads and writes
+    are made to the top layer only.
+
+    Resolved lookups are cached. The cache is dropped whenever a layer is
+    pushed or popped or any of the layers is changed. Layers bump the version
+    of the chains containing them when they change, so checking the cache
+    takes constant time however many layers there are.
+    """
+    def __init__(self, *layers):
+        self._layers = list(layers) or [ConfigStore()]
+        self._cache = {}
+        self._state = None
+        self._version = 0
+        self._chains = weakref.WeakKeyDictionary()
+        for layer in self._layers:
+            layer._chains[self] = True
+
+    def _lookup(self, section, key):
+        """ Return the ``(value, source)`` of a key, or ``None`` if not set. """
+        state = self._version
+        if state != self._state:
+            self._cache.clear()
+            self._state = state
+        try:
+            return self._cache[(section, key)]
+        except KeyError:
+            pass
+        result = None
+        for layer in reversed(self._layers):
+            value = layer.get(section, key, _missing)
+            if value is not _missing:
+                result = (value, layer.source(section, key))
+                break
+        self._cache[(section, key)] = result
+        return result
+
+    @property
+    def layers(self):
+        """ The list of layers, from the lowest to the highest priority. """
+        return list(self._layers)
+
+    def push(self, store=None):
+        """ Push a new top layer and return it. """
+        store = store if store is not None else ConfigStore()
+        self._layers.append(store)
+        store._chains[self] = True
+        self._changed()
+        return store
+
+    def pop(self):
+        """ Remove the top layer and return it. """
+        if len(self._layers) < 2:
+            raise IndexError("cannot pop the last layer")
+        store = self._layers.pop()
+        if not any(layer is store for layer in self._layers):
+            store._chains.pop(self, None)
+        self._changed()
+        return store
+
+    def __contains__(self, section):
+        return any(section in layer for layer in self._layers)
+
+    def __iter__(self):
+        for section in self.sections():
+            yield section
+
+    def copy(self):
+        """ Create a new view of the same layers with a copy of the top layer. """
+        return self.__class__(*(self._layers[:-1] + [self._layers[-1].copy()]))
+
+    def get(self, section, key, default=None):
+        result = self._lookup(section, key)
+        return default if result is None else result[0]
+
+    def source(self, section, key):
+        result = self._lookup(section, key)
+        return None if result is None else result[1]
+
+    def set(self, section, key, value, source=None):
+        self._layers[-1].set(section, key, value, source)
+
+    def unset(self, section, key):
+        """
+        Remove a configuration field from the top layer. A value set for the
+        key by a lower layer shows through again.
+        """
+        self._layers[-1].unset(section, key)
+
+    def update(self, src):
+        self._layers[-1].update(src)
+
+    def update_section(self, section, items, source=None):
+        self._layers[-1].update_section(section, items, source)
+
+    def read(self, fp):
+        """ Read a file into the top layer, which must be a file based store. """
+        self._layers[-1].read(fp)
+
+    def read_file(self, fname, snapshot=False):
+        layer = self._layers[-1]
+        if hasattr(layer, 'read_file'):
+            layer.read_file(fname, snapshot)
+        else:
+            with open(fname, 'r') as f:
+                layer.read(f)
+
+    def write(self, fp):
+        """ Write the top layer to a file. """
+        self._layers[-1].write(fp)
+
+    def sections(self):
+        sections = set()
+        for layer in self._layers:
+            sections.update(layer.sections())
+        return list(sections)
+
+    def items(self, section):
+        return self._merged_section(section).iteritems()
+
+    def _merged_section(self, section):
+        data = {}
+        for layer in self._layers:
+            data.update(layer._data.get(section, {}))
+        return data
+
+    @property
+    def _data(self):
+        return dict((s, self._merged_section(s)) for s in self.sections())
+
+    @property
+    def _source(self):
+        source = {}
+        for layer in self._layers:
+            source.update(layer._source)
+        return source
+
+
 class FileConfigStore(ConfigStore):
     """
     File based configuration store.
@@ -96,14 +342,42 @@ class FileConfigStore(ConfigStore):
 
     Children of ``FileConfigStore`` must implement the ``read`` method which
     takes a file object to read from.
+
+    Files can optionally be read through a snapshot: the parsed data is saved
+    in binary form next to the file (see ``snapshot_name``) and loaded from
+    there instead of parsing the file again for as long as the modification
+    time and size of the file are unchanged.
     """
     @classmethod
-    def load_file(cls, fname):
+    def load_file(cls, fname, snapshot=False):
         config = cls()
-        with open(fname, 'r') as f:
-            config.read(f)
+        config.read_file(fname, snapshot)
         return config
 
+    def read_file(self, fname, snapshot=False):
+        """ Read a configuration file by name, optionally through a snapshot. """
+        if not snapshot:
+            with open(fname, 'r') as f:
+                self.read(f)
+            return
+
+        st = os.stat(fname)
+        stamp = (st.st_mtime, st.st_size)
+        snapshot = snapshot_name(fname)
+        data = _load_snapshot(snapshot, stamp)
+        if data is None:
+            store = self.__class__()
+            with open(fname, 'r') as f:
+                store.read(f)
+            data = store._data
+            # A file changed again within the resolution of its modification
+            # time would go unnoticed, so recently changed files are not
+            # snapshotted yet.
+            if time.time() - st.st_mtime > 2:
+                _save_snapshot(snapshot, stamp, data)
+        for section, items in data.iteritems():
+            self.update_section(section, items, fname)
+
 
 class IniConfigStore(FileConfigStore):
     """
@@ -112,24 +386,224 @@ class IniConfigStore(FileConfigStore):
     Represents configuration data that has been read from an INI file or may be
     stored to an INI file. The ``IniConfigStore`` class may be directly
     instantiated.
+
+    The INI syntax is that of the ``RawConfigParser`` of the ``configparser``
+    module:
+
+      - Lines whose first non-blank character is '#' or ';' are comments.
+      - Keys are separated from their values by '=' or ':' and are lower-cased.
+      - Lines indented deeper than their key continue its value, blank lines
+        within a value are kept.
+      - The keys of the ``[DEFAULT]`` section are added to all other sections
+        that do not set them.
+
+    A section that appears more than once in a file, or a key that appears
+    more than once in a section, raises ConfigParseError.
     """
     def __init__(self, src=None):
         ConfigStore.__init__(self, src)
 
     def read(self, fp):
-        parser = RawConfigParser()
-        parser.readfp(fp)
-        for section in parser.sections():
-            for key, value in parser.items(section):
-                self.set(section, key, value, path(fp.name).abspath())
+        """
+        Read an INI file from a file object.
+
+        The file is parsed line by line in a single pass and each section is
+        added to the store as soon as it ends. A ``ConfigParseError`` with the
+        offending line number is raised on syntax errors.
+        """
+        fname = getattr(fp, 'name', '<???>')
+        source = fname if fname != '<???>' else None
+        sections, defaults, seen = [], {}, set()
+        name, data, key, lines, indent = None, None, None, None, 0
+
+        def flush():
+            if key is not None:
+                data[key] = '\n'.join(lines).rstrip()
+
+        for lineno, line in enumerate(fp, 1):
+            value = line.strip()
+            if not value:
+                if key is not None:
+                    lines.append('')
+                continue
+            if value[0] in '#;':
+                continue
+            level = len(line) - len(line.lstrip())
+            if key is not None and level > indent:
+                # Continuation line.
+                lines.append(value)
+                continue
+            flush()
+            key, indent = None, level
+            m = _section_re.match(value)
+            if m:
+                if name is not None and name != 'DEFAULT':
+                    self.update_section(name, data, source)
+                name = m.group('header')
+                if name in seen:
+                    raise ConfigParseError(fname, lineno,
+                                           'duplicate section %r' % name)
+                seen.add(name)
+                data = defaults if name == 'DEFAULT' else {}
+                if name != 'DEFAULT' and name not in sections:
+                    sections.append(name)
+                continue
+            if data is None:
+                raise ConfigParseError(fname, lineno,
+                                       'no section header before %r' % value)
+            m = _option_re.match(value)
+            if not m:
+                raise ConfigParseError(fname, lineno, 'invalid line %r' % value)
+            key, lines = m.group('key').rstrip().lower(), [m.group('value')]
+            if key in data:
+                raise ConfigParseError(fname, lineno, 'duplicate key %r in '
+                                       'section %r' % (key, name))
+        flush()
+        if name is not None and name != 'DEFAULT':
+            self.update_section(name, data, source)
+        if defaults:
+            for name in sections:
+                section = self._data[name]
+                missing = dict((k, v) for k, v in defaults.iteritems()
+                               if k not in section)
+                self.update_section(name, missing, source)
 
     def write(self, fp):
-        parser = RawConfigParser()
+        """ Write the store to a file object in INI format. """
         for section in self:
-            parser.add_section(section)
+            fp.write('[%s]\n' % section)
             for key, value in self.items(section):
-                parser.set(section, key, value)
-        parser.write(fp)
+                fp.write('%s = %s\n' % (key, str(value).replace('\n', '\n\t')))
+            fp.write('\n')
+
+
+def _stamp(fname):
+    """ Return a tuple that changes whenever a file is changed or replaced. """
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size, st.st_ino)
+
+
+class _StatWatcher(object):
+    """ Watch files for changes by polling their status. """
+    def __init__(self):
+        self._stamps = {}
+
+    def fileno(self):
+        return None
+
+    def add(self, fname):
+        self._stamps[fname] = _stamp(fname)
+
+    def _check(self, fnames):
+        changed = []
+        for fname in fnames:
+            stamp = _stamp(fname)
+            if stamp != self._stamps[fname]:
+                self._stamps[fname] = stamp
+                changed.append(fname)
+        return changed
+
+    def changed(self, timeout=0):
+        """
+        Return the watched files changed since the last call, waiting up to
+        ``timeout`` seconds for a change if there is none yet.
+        """
+        changed = self._check(self._stamps)
+        if not changed and timeout:
+            time.sleep(timeout)
+            changed = self._check(self._stamps)
+        return changed
+
+    def close(self):
+        pass
+
+
+class _InotifyWatcher(_StatWatcher):
+    """
+    Watch files for changes with Linux inotify.
+
+    The directories of the files are watched rather than the files themselves
+    so that files replaced by renaming a new file over them are noticed. Files
+    named in the events are then checked as by the ``_StatWatcher``.
+    """
+    # IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    mask = 0x0008 | 0x0040 | 0x0080 | 0x0100 | 0x0200
+    IN_Q_OVERFLOW = 0x4000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self, libc):
+        _StatWatcher.__init__(self)
+        self._libc = libc
+        self._dirs = {}
+        self._fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(self._errno(), "inotify_init1 failed")
+
+    @staticmethod
+    def _errno():
+        import ctypes
+        return ctypes.get_errno()
+
+    def fileno(self):
+        return self._fd
+
+    def add(self, fname):
+        _StatWatcher.add(self, fname)
+        dirname = os.path.dirname(fname)
+        if dirname not in self._dirs.values():
+            wd = self._libc.inotify_add_watch(self._fd, dirname, self.mask)
+            if wd < 0:
+                raise OSError(self._errno(), "inotify_add_watch failed", dirname)
+            self._dirs[wd] = dirname
+
+    def _events(self, timeout):
+        """ Return the names of the files in the pending events. """
+        names = set()
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return names
+        while True:
+            try:
+                buf = os.read(self._fd, 65536)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return names
+                raise
+            pos = 0
+            while pos < len(buf):
+                wd, mask, cookie, length = struct.unpack_from('iIII', buf, pos)
+                pos += 16
+                name = buf[pos:pos + length].rstrip('\0')
+                pos += length
+                if mask & self.IN_Q_OVERFLOW:
+                    names.update(self._stamps)
+                elif wd in self._dirs:
+                    names.add(os.path.join(self._dirs[wd], name))
+
+    def changed(self, timeout=0):
+        names = self._events(timeout)
+        return self._check(f for f in self._stamps if f in names)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def _watcher(inotify=True):
+    """ Return an inotify based file watcher if available or a stat based one. """
+    if inotify and sys.platform.startswith('linux'):
+        try:
+            import ctypes, ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                               use_errno=True)
+            return _InotifyWatcher(libc)
+        except (ImportError, OSError, AttributeError):
+            pass
+    return _StatWatcher()
 
 
 class Config(object):
@@ -140,44 +614,125 @@ class Config(object):
     access functions to read the configuration data back in a more useful form.
     This is particularly true for configuration fields that contain paths.
     Additionally, file read and write methods are provided.
+
+    The typed accessors (``configint``, ``configbool``, ``configlist`` and
+    ``configpath``) convert a value once and cache the result per key. The
+    cache entry of a key is dropped when it is changed through ``setconfig``,
+    ``unsetconfig`` or ``updateconfig``; any other change to the store drops
+    the whole cache.
     """
     def __init__(self, store=None):
         self._store = store or IniConfigStore()
+        self._cache = {}
+        self._state = None
 
     def copy(self):
         return self.__class__(self._store.copy())
 
+    def _converted(self, section, item, kind, convert):
+        """ Return the cached conversion of a value, ``None`` if not set. """
+        state = self._store._version
+        if state != self._state:
+            self._cache.clear()
+            self._state = state
+        try:
+            return self._cache[(section, item)][kind]
+        except KeyError:
+            pass
+        value = self._store.get(section, item)
+        if value is not None:
+            value = convert(section, item, value)
+        self._cache.setdefault((section, item), {})[kind] = value
+        return value
+
+    def _invalidate(self, state, keys):
+        """
+        Drop the cached conversions of the given keys after a change to the
+        store, which was in ``state`` before the change.
+        """
+        if state == self._state:
+            for key in keys:
+                self._cache.pop(key, None)
+            self._state = self._store._version
+
     def config(self, section, item, default=None):
         """ Get a configuration value as a string. """
         return self._store.get(section, item, default)
 
-    def configpath(self, section, item, default=None):
-        """ Get a configuration value as a relative path to the source. """
-        p = path(self._store.get(section, item))
-        if not p:
-            return default
+    def _toint(self, section, item, value):
+        try:
+            return int(value)
+        except ValueError:
+            raise ConfigValueError(section, item, "invalid integer %r" % value)
+
+    def _tobool(self, section, item, value):
+        try:
+            return _bool_values[value.lower()]
+        except KeyError:
+            raise ConfigValueError(section, item, "invalid boolean %r" % value)
+
+    def _tolist(self, section, item, value):
+        return tuple(v for v in _list_sep_re.split(value) if v)
+
+    def _topath(self, section, item, value):
+        p = path(value)
         src = self.source(section, item)
-        if not src:
-            return default
+        if not p or not src:
+            return None
         return path(src) / p.expanduser()
 
+    def configint(self, section, item, default=None):
+        """ Get a configuration value as an integer. """
+        value = self._converted(section, item, 'int', self._toint)
+        return default if value is None else value
+
+    def configbool(self, section, item, default=None):
+        """
+        Get a configuration value as a boolean. '1', 'yes', 'true' and 'on' are
+        true, '0', 'no', 'false' and 'off' are false.
+        """
+        value = self._converted(section, item, 'bool', self._tobool)
+        return default if value is None else value
+
+    def configlist(self, section, item, default=None):
+        """ Get a configuration value as a list of comma or blank separated words. """
+        value = self._converted(section, item, 'list', self._tolist)
+        return default if value is None else list(value)
+
+    def configpath(self, section, item, default=None):
+        """ Get a configuration value as a relative path to the source. """
+        value = self._converted(section, item, 'path', self._topath)
+        return default if value is None else value
+
     def source(self, section, item):
         """ Get the source that set a configuration value. """
         return self._store.source(section, item)
 
     def setconfig(self, section, item, value, source=None):
         """ Add or update a configuration value. """
+        state = self._store._version
         self._store.set(section, item, value, source=source)
+        self._invalidate(state, [(section, item)])
 
     def updateconfig(self, cfg):
         """ Update configuration from another ``Config`` instance. """
         self._store.update(cfg._store)
+        self._cache.clear()
 
     def unsetconfig(self, section, item):
         """ Remove a configuration value from the store. """
+        state = self._store._version
         self._store.unset(section, item)
-
-    def read_file(self, fname):
+        self._invalidate(state, [(section, item)])
+
+    def read_file(self, fname, snapshot=False):
+        """
+        Read a configuration file. With ``snapshot`` the file is read through
+        a binary snapshot (see ``FileConfigStore``) if the store supports it.
+        """
+        if snapshot and hasattr(self._store, 'read_file'):
+            self._store.read_file(fname, snapshot)
+            return
         with open(fname, 'r') as f:
             self._store.read(f)
 
@@ -185,3 +740,114 @@ class Config(object):
         with open(fname, 'w') as f:
             self._store.write(f)
 
+
+class WatchedConfig(Config):
+    """
+    Configuration that follows changes to the files it was read from.
+
+    Files read with ``read_file`` are watched, with inotify where available and
+    by polling their status otherwise. Long running processes call ``poll``
+    from their main loop (or when ``fileno`` becomes readable) to re-read the
+    changed files. Only the values that actually changed are applied to the
+    store, after which the registered callbacks are called with the config and
+    the list of changed ``(section, key)`` pairs.
+
+    A value set by several files is taken from the last file read that sets
+    it, as when the files were read in the first place. Changes made to a key
+    with ``setconfig`` stand until a file changes the key again.
+    """
+    def __init__(self, store=None, inotify=True):
+        Config.__init__(self, store)
+        self._watcher = _watcher(inotify)
+        self._files = []
+        self._filedata = {}
+        self._callbacks = []
+
+    def _load(self, fname, snapshot=False):
+        """
+        Parse a file with the class of the store, or as an INI file if the
+        store is not a ``FileConfigStore`` (e.g. a ``ChainConfigStore``).
+        """
+        cls = self._store.__class__
+        if not issubclass(cls, FileConfigStore):
+            cls = IniConfigStore
+        return cls.load_file(fname, snapshot)._data
+
+    def read_file(self, fname, snapshot=False):
+        fname = os.path.abspath(fname)
+        # Start watching first so that a change made while the file is read is
+        # not missed.
+        self._watcher.add(fname)
+        data = self._load(fname, snapshot)
+        for section, items in data.iteritems():
+            self._store.update_section(section, items, fname)
+        if fname in self._files:
+            self._files.remove(fname)
+        self._files.append(fname)
+        self._filedata[fname] = data
+
+    def add_callback(self, callback):
+        """ Register ``callback(config, changes)`` to be called on changes. """
+        self._callbacks.append(callback)
+
+    def remove_callback(self, callback):
+        self._callbacks.remove(callback)
+
+    def fileno(self):
+        """ The inotify file descriptor, or ``None`` when polling. """
+        return self._watcher.fileno()
+
+    def close(self):
+        """ Stop watching the files. """
+        self._watcher.close()
+
+    def poll(self, timeout=0):
+        """
+        Re-read the watched files that changed and apply the changes. Waits up
+        to ``timeout`` seconds for a change. Returns the list of changed
+        ``(section, key)`` pairs.
+        """
+        changes = []
+        changed = set(self._watcher.changed(timeout))
+        for fname in self._files:
+            if fname in changed:
+                changes.extend(self._reload(fname))
+        if changes:
+            for callback in list(self._callbacks):
+                callback(self, changes)
+        return changes
+
+    def _reload(self, fname):
+        try:
+            new = self._load(fname)
+        except (IOError, OSError, ConfigParseError):
+            # The file is being replaced or is broken; keep the values read
+            # last and try again on its next change.
+            return []
+        old = self._filedata[fname]
+        self._filedata[fname] = new
+
+        state = self._store._version
+        changes = []
+        for section in set(old) | set(new):
+            o, n = old.get(section, {}), new.get(section, {})
+            for key in set(o) | set(n):
+                if o.get(key, _missing) == n.get(key, _missing):
+                    continue
+                # The value may still be overridden by a later file.
+                for owner in reversed(self._files):
+                    value = self._filedata[owner].get(section, {}).get(key, _missing)
+                    if value is not _missing:
+                        break
+                else:
+                    owner = None
+                if (self._store.get(section, key, _missing) == value and
+                        self._store.source(section, key) == owner):
+                    continue
+                if owner is None:
+                    self._store.unset(section, key)
+                else:
+                    self._store.set(section, key, value, owner)
+                changes.append((section, key))
+        self._invalidate(state, changes)
+        return changes
@@ -2,6 +2,11 @@
 
 import os
 
+try:
+    from configparser import Error as _ConfigParserError
+except ImportError:
+    from ConfigParser import Error as _ConfigParserError
+
 class SignatureError(Exception):
     """Exception raised due to a command function called with bad signature."""
     pass
@@ -18,6 +23,20 @@ class RSTParseError(Exception):
     """Exception raised due to error parsing RST source."""
     pass
 
+class ConfigParseError(_ConfigParserError):
+    """Exception raised due to error parsing a configuration file."""
+    def __init__(self, fname, lineno, msg):
+        _ConfigParserError.__init__(self, "%s:%d: %s" % (fname, lineno, msg))
+        self.fname = fname
+        self.lineno = lineno
+
+class ConfigValueError(Exception):
+    """Exception raised due to a configuration value of the wrong type."""
+    def __init__(self, section, key, msg):
+        Exception.__init__(self, "%s.%s: %s" % (section, key, msg))
+        self.section = section
+        self.key = key
+
 class OptionsError(Exception):
     """Exception raised due to error parsing the command line options."""
     pass
@@ -5,9 +5,9 @@ import fnmatch
 import types
 import re
 import StringIO
+import time
 import util
 
-from mako.template import Template
 from path import path
 from subprocess import Popen, STDOUT
 
@@ -15,7 +15,41 @@ from subprocess import Popen, STDOUT
 var_re = re.compile(r"%(.+?)%")
 
 
+class _StatusSummary(object):
+    """
+    Internal class used to count the file statuses reported by a ``FileOp``.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self.counts = {}
+        self.order = []
+        self.total = 0
+        self.started = self.updated = time.time()
+
+    def add(self, msg):
+        if msg not in self.counts:
+            self.counts[msg] = 0
+            self.order.append(msg)
+        self.counts[msg] += 1
+        self.total += 1
+
+    def due(self):
+        now = time.time()
+        if now - self.updated < self.interval:
+            return False
+        self.updated = now
+        return True
+
+    def line(self):
+        elapsed = time.time() - self.started
+        counts = ", ".join("%s %d" % (m, self.counts[m]) for m in self.order)
+        return "%d files: %s (%.1fs, %d files/s)" % (
+                self.total, counts, elapsed, self.total / max(elapsed, 1e-3))
+
+
 class FileOp(object):
+    summary_hidden = ("identical", "exist")
+
     def __init__(self, ui, srcroot, dstroot):
         self.ui = ui
         self.srcroot = path(srcroot)
@@ -26,6 +60,7 @@ class FileOp(object):
         self.skip = False
 
         self.template_vars = {}
+        self._summary = None
 
     def get(self, key, default=None):
         return self.template_vars.get(key, default)
@@ -81,9 +116,40 @@ class FileOp(object):
                 self.dstroot = dstroot
         return context()
 
+    def summarize(self, interval=0.1):
+        """
+        Summarize file statuses instead of reporting every file.
+
+        A new context object is created that on entry starts counting the
+        statuses reported by file operations. Statuses listed in
+        ``summary_hidden`` (files and directories left untouched) are only
+        counted, unless the ui is ``verbose``; all others are reported as usual.
+        A progress line with the counts per status and the throughput is shown
+        at most every ``interval`` seconds. On exit a final summary line is
+        written.
+        """
+        summary = self._summary
+        class context(object):
+            def __enter__(self_):
+                self._summary = _StatusSummary(interval)
+            def __exit__(self_, exc_type, exc_value, exc_tb):
+                if self._summary.total:
+                    self.ui.status("%s\n" % self._summary.line())
+                self._summary = summary
+        return context()
+
     def status(self, msg, p, color=None):
+        summary = self._summary
+        if summary is not None:
+            summary.add(msg.lower())
+            if msg.lower() in self.summary_hidden and not self.ui.verbose:
+                if summary.due():
+                    self.ui.progress(summary.line())
+                return
         self.ui.status("%s" % msg.lower().rjust(12), color=color)
         self.ui.status("  %s\n" % path(p).relpath())
+        if summary is not None and summary.due():
+            self.ui.progress(summary.line())
 
     def cmd(self, cmd_, *args, **kw):
         """
@@ -310,6 +376,8 @@ class FileOp(object):
         dst = self.dst(dst or src)
         src = self.src(src)
         def srcfn():
+            # Mako is imported on first use as it is slow to import.
+            from mako.template import Template
             try:
                 d = Template(filename=str(src)).render(**self.template_vars)
             except NameError as e:
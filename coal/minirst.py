@@ -16,6 +16,7 @@ The current constructs supported are:
   - Definition Lists
   - Literal Blocks
   - Containers
+  - Inline markup (emphasis, strong emphasis, literals and interpreted text)
 
 The source text is first pre-processed into a list of 2-tuples where each
 2-tuple represents a source text line as the line identation and the lines text
@@ -23,20 +24,34 @@ with leading and trailing whitespace removed. All processing of the source lines
 are performed on this list of 2-tuples.
 
 Parsing of the source text is performed in a recursive manner by a set of parse
-functions. Each of the parse functions returns a 3-tuple: the first element is a
-boolean indicating if the match and successive parsing succeeded, a format
-function that when called will generate the formatted output of the parsed
-source text, and the remaining source to be parsed. This allowes the true nested
+functions. Each parse function is passed the list of source lines and the index
+of the current line and returns a 3-tuple: the first element is a boolean
+indicating if the match and successive parsing succeeded, a format function that
+when called will generate the lines of formatted output of the parsed source
+text, and the index of the next line to be parsed. This allowes the true nested
 nature of the reStructuredText to be maintained for more accurate formatting
-while keeping the parsing simple and concise.
+while keeping the parsing simple and concise. The source lines are never
+modified or removed from the front of the list, so parsing is linear in the
+length of the source. Likewise, output lines are generated one at a time and
+passed up through the nested format functions, so a document may be written
+out as it is rendered.
 
 Additional elements can be added by adding appropriate parse functions to the
-``_transitions`` list.
+``_transitions`` list. A parse function may declare the characters a matching
+line can start with in its ``first`` attribute; it is then only tried on lines
+starting with one of them.
+
+Since the result of parsing is a tree of format functions that may be rendered
+at any width, ``parse`` returns a ``Document`` that can be rendered repeatedly.
+Parsed documents are kept in a small LRU cache keyed by the source text so that
+formatting the same text again skips parsing entirely.
 """
 
 
+import collections
 import error
 import re
+import string
 import util
 
 
@@ -75,28 +90,41 @@ _admonitions = {
 
 def _wrap(s, width, indent, subindent=None):
     subindent = subindent or indent
-    return util.wrap(s, width, indent=indent, subindent=subindent)
+    return util.wrap(s, width, indent=indent, subindent=subindent, cache=True)
 
 
-def simple_block(src):
+def first(chars):
     """
-    Parses out a simple block of continuous lines of text.
+    Decorator declaring the characters a line matched by a parse function can
+    start with.
     """
-    for i, v in enumerate(src):
-        if not v[1]:
-            return src[:i], src[i:]
-    return src, []
+    def decorator(fn):
+        fn.first = chars
+        return fn
+    return decorator
 
 
-def nested_block(src, shift_first=None, strip_indent=True):
+def simple_block(src, i=0):
+    """
+    Parses out a simple block of continuous lines of text starting at line
+    ``i``. Returns the block and the index of the line following it.
+    """
+    end, last = i, len(src)
+    while end < last and src[end][1]:
+        end += 1
+    return src[i:end], end
+
+
+def nested_block(src, i=0, shift_first=None, strip_indent=True):
     """
     Return a list of nested lines (indentation > 0).
 
-    Groups all indented lines from ``src`` and optionally strips common
-    indentation from them (enabled by default). Indentation relative to each
-    other is maintained. This maintains the nested nature of the RST source
-    text. Stripping away the common indentation of the grouped lines allowes the
-    new list of lines to be treated as new RST source.
+    Groups all indented lines from ``src`` starting at line ``i`` into a new
+    list of lines and optionally strips common indentation from them (enabled
+    by default). Indentation relative to each other is maintained. This
+    maintains the nested nature of the RST source text. Stripping away the
+    common indentation of the grouped lines allowes the new list of lines to be
+    treated as new RST source.
 
     The indentation of the first line of text may be specified independently of
     the rest of the text. If specified, the first line of text is stripped of
@@ -105,12 +133,15 @@ def nested_block(src, shift_first=None, strip_indent=True):
     lines. If the rest of the lines share a common indentation of non-0, then
     they are stripped accordingly.
 
+    Returns the block of lines and the index of the line following it.
+
     :Parameters:
       - `src`: List of pre-processed Restructured Text lines.
+      - `i`: Index of the first line of the block.
       - `Shift_first`: Number of characters to strip from the first line.
       - `strip_indent`: Strip common indentation from block if specified.
     """
-    end, last, indent = 0, len(src), None
+    end, last, indent = i, len(src), None
     if shift_first is not None:
         end += 1
     while end < last:
@@ -120,22 +151,20 @@ def nested_block(src, shift_first=None, strip_indent=True):
                 break
             indent = (line[0] if indent is None else min(indent, line[0]))
         end += 1
-    block, src[:end] = src[:end], []
-    if block:
-        if indent and strip_indent:
-            for l in block:
-                l[0] -= indent
-        if shift_first is not None:
-            block[0][0] = 0
-            block[0][1] = block[0][1][shift_first:]
-        while block and not block[0][1]:
-            block.pop(0)
-        while block and not block[-1][1]:
-            block.pop(-1)
-    return block, src
-
-
-def parse_blank(src):
+    shift = indent if indent and strip_indent else 0
+    block = [[l[0] - shift, l[1]] for l in src[i:end]]
+    if block and shift_first is not None:
+        block[0] = [0, block[0][1][shift_first:]]
+    head, tail = 0, len(block)
+    while head < tail and not block[head][1]:
+        head += 1
+    while tail > head and not block[tail - 1][1]:
+        tail -= 1
+    del block[tail:], block[:head]
+    return block, end
+
+
+def parse_blank(src, i):
     """
     Parse a blank line.
 
@@ -145,13 +174,12 @@ def parse_blank(src):
     this parse function will simply match and consume the line but result in no
     additional generated content.
     """
-    if src[0][1]:
-        return False, None, src
-    src.pop(0)
-    return True, None, src
+    if src[i][1]:
+        return False, None, i
+    return True, None, i + 1
 
 
-def parse_nested(src):
+def parse_nested(src, i):
     """
     Parses a nested block of RST text.
 
@@ -164,18 +192,19 @@ def parse_nested(src):
     pre-processed RST lines and then parsing them with the ``parse_body``
     function. This followes the nested/recursive nature of RST sources.
     """
-    if src[0][0] == 0:
-        return False, None, src
-    nested, src = nested_block(src)
+    if src[i][0] == 0:
+        return False, None, i
+    nested, i = nested_block(src, i)
     content = parse_body(nested)
 
     def body(width, indent, **kw):
         return content(width, indent + "  ", **kw)
 
-    return True, body, src
+    return True, body, i
 
 
-def parse_container(src):
+@first(".")
+def parse_container(src, i):
     """
     Parse a RST container into the container content and name.
 
@@ -184,21 +213,23 @@ def parse_container(src):
     to the returned format function. If the ``keep`` keyword is not specified or
     is specified as ``None``, then all containers will be kept.
     """
-    if not (len(src) > 2 and src[1][1] == "" and
-            src[0][1].startswith(".. container::")):
-        return False, None, src
-    name = src.pop(0)[1][14:].strip()
-    nested, src = nested_block(src)
+    if not (len(src) - i > 2 and src[i + 1][1] == "" and
+            src[i][1].startswith(".. container::")):
+        return False, None, i
+    name = src[i][1][14:].strip()
+    nested, i = nested_block(src, i + 1)
     body = parse_body(nested)
 
     def container(width, indent, keep=None, **kw):
         if keep is None or name in keep:
             return body(width, indent, keep=keep, **kw)
+        return ()
 
-    return True, container, src
+    return True, container, i
 
 
-def parse_admonition(src):
+@first(".")
+def parse_admonition(src, i):
     """
     Parse admonition blocks.
 
@@ -207,20 +238,23 @@ def parse_admonition(src):
     valid admonitions are defined in the ``_admonitions`` dictionary which map
     the understood admonition directives to their topic titles.
     """
-    m = _admonition_re.match(src[0][1])
+    m = _admonition_re.match(src[i][1])
     if not m:
-        return False, None, src
+        return False, None, i
     title = _admonitions[m.group(1).lower()]
-    nested, src = nested_block(src, shift_first=m.end(0))
+    nested, i = nested_block(src, i, shift_first=m.end(0))
     body = parse_body(nested)
 
     def admonition(width, indent, **kw):
-        return "%s%s\n%s" % (indent, title, body(width, indent + "  ", **kw))
+        yield indent + title
+        for line in body(width, indent + "  ", **kw):
+            yield line
 
-    return True, admonition, src
+    return True, admonition, i
 
 
-def parse_list(item_match, src, max_keywidth=None, min_space=1, vspace=False):
+def parse_list(item_match, src, i, max_keywidth=None, min_space=1,
+               vspace=False):
     """
     Parse a RST list of items.
 
@@ -234,40 +268,48 @@ def parse_list(item_match, src, max_keywidth=None, min_space=1, vspace=False):
     :Parameters:
       - `item_match`: The item match function
       - `src`: The list of RST source lines
+      - `i`: The index of the first line of the list
       - `max_keywidth`: The maximum width of the key field in the output
       - `min_space`: The minimum whitespace between key field and item body
            formatted output text
       - `vspace`: If ``True``, insert a blank line between every list item
     """
-    m = item_match(src)
+    m = item_match(src, i)
     if not m:
-        return False, None, src
+        return False, None, i
     items = []
     while m:
-        block, src = nested_block(src, shift_first=m.offset)
+        block, i = nested_block(src, i, shift_first=m.offset)
         items.append((m.key, parse_body(block)))
-        m = src and item_match(src)
+        m = i < len(src) and item_match(src, i)
 
-    keywidth = max(len(item[0]) for item in items) + min_space
+    keywidth = max(util.display_width(item[0]) for item in items) + min_space
     if max_keywidth is not None:
         keywidth = min(keywidth, max_keywidth)
 
     def list_(width, indent, **kw):
         hanging = indent + (keywidth * " ")
         offset = len(indent) + keywidth
-        result = []
-        for item in items:
-            content = item[1](width, hanging, **kw)
-            if len(item[0]) + min_space > keywidth:
-                content = indent + item[0] + "\n" + content
+        spaced = False
+        for n, item in enumerate(items):
+            # Items are separated by a blank line if the previous item
+            # contained one.
+            if n and (vspace or spaced):
+                yield ""
+            content = iter(item[1](width, hanging, **kw))
+            if util.display_width(item[0]) + min_space > keywidth:
+                line = indent + item[0]
             else:
-                content = indent + item[0].ljust(keywidth) + content[offset:]
-            if result and (vspace or result[-1].find("\n\n") != -1):
-                result.append("")
-            result.append(content)
-        return "\n".join(result)
+                line = (indent + util.ljust(item[0], keywidth) +
+                        next(content, "")[offset:])
+            yield line
+            spaced, blank = False, False
+            for line in content:
+                spaced = spaced or blank
+                blank = not line
+                yield line
 
-    return True, list_, src
+    return True, list_, i
 
 
 class ListItemMatch(object):
@@ -275,48 +317,107 @@ class ListItemMatch(object):
         self.key, self.offset = key, offset
 
 
-def match_list(item_re, src):
-    m = item_re.match(src[0][1])
+def match_list(item_re, src, i):
+    m = item_re.match(src[i][1])
     if not m:
         return None
     return ListItemMatch(m.group(1), m.end(0))
 
 # Match and parse bullet and numbered lists.
-def match_bullet(src):
-    return match_list(_bullet_re, src)
-def parse_bullet(src):
-    return parse_list(match_bullet, src)
+def match_bullet(src, i):
+    return match_list(_bullet_re, src, i)
+@first("-(|" + string.ascii_letters + string.digits)
+def parse_bullet(src, i):
+    return parse_list(match_bullet, src, i)
 
 # Match and parse *nix style option lists.
-def match_option(src):
-    return match_list(_option_re, src)
-def parse_option(src):
-    return parse_list(match_option, src, max_keywidth=14, min_space=2)
+def match_option(src, i):
+    return match_list(_option_re, src, i)
+@first("-")
+def parse_option(src, i):
+    return parse_list(match_option, src, i, max_keywidth=14, min_space=2)
 
 # Match and parse field lists.
-def match_field(src):
-    return match_list(_field_re, src)
-def parse_field(src):
-    return parse_list(match_field, src, max_keywidth=14, min_space=2)
+def match_field(src, i):
+    return match_list(_field_re, src, i)
+@first(":")
+def parse_field(src, i):
+    return parse_list(match_field, src, i, max_keywidth=14, min_space=2)
 
 # Match definition lists. Note that definition list matching must be performed
 # after all other lists matches are attempted and prior to matching a paragraph.
-def match_definition(src):
-    if len(src) > 1 and src[0][0] < src[1][0]:
-        return ListItemMatch(src[0][1], len(src[0][1]))
+def match_definition(src, i):
+    if len(src) > i + 1 and src[i][0] < src[i + 1][0]:
+        return ListItemMatch(src[i][1], len(src[i][1]))
     return None
-def parse_definition(src):
-    return parse_list(match_definition, src, max_keywidth=2, min_space=2,
+def parse_definition(src, i):
+    return parse_list(match_definition, src, i, max_keywidth=2, min_space=2,
                       vspace=True)
 
 
 def inline_code(s):
     return "\"%s\"" % s
 
+def inline_text(s):
+    return s
+
 inline_handlers = [
-    ("code", inline_code)
+    ("code", inline_code),
+    ("emphasis", inline_text),
+    ("literal", inline_code),
+    ("strong", inline_text)
 ]
 
+# Inline markup and interpreted text matched in a single pass. The ``roles``
+# alternation is filled in with the names of the registered inline handlers.
+_inline_pattern = r"""
+    ``(?P<literal>.+?)``
+  | (?<![\w*])\*\*(?P<strong>\S(?:.*?\S)?)\*\*(?![\w*])
+  | (?<![\w*])\*(?P<emphasis>[^\s*](?:[^*]*?[^\s*])?)\*(?![\w*])
+  | :(?P<prefix_role>%(roles)s):`(?P<prefix_text>[^`]+)`
+  | `(?P<suffix_text>[^`]+)`:(?P<suffix_role>%(roles)s):"""
+
+_inline_re = None
+_inline_roles = None
+_inline_snapshot = None
+
+
+def register_role(name, handler):
+    """
+    Register the handler of an inline role.
+
+    The handler is called with the text of each ":name:`text`" or
+    "`text`:name:" construct and returns the text to replace it with. The
+    handlers of the "emphasis", "strong" and "literal" roles are also used for
+    "*text*", "**text**" and "``text``" inline markup. Registering a handler
+    for an already registered role replaces it.
+
+    Since inline text is interpreted when the source is parsed, the cache of
+    parsed documents is cleared.
+    """
+    for i, h in enumerate(inline_handlers):
+        if h[0] == name:
+            inline_handlers[i] = (name, handler)
+            break
+    else:
+        inline_handlers.append((name, handler))
+    _cache.clear()
+
+
+def _inline_table():
+    """
+    Return the compiled inline regular expression and the role handlers,
+    rebuilding them only when ``inline_handlers`` has changed.
+    """
+    global _inline_re, _inline_roles, _inline_snapshot
+    if _inline_snapshot != inline_handlers:
+        roles = "|".join(re.escape(h[0]) for h in inline_handlers) or "(?!)"
+        _inline_re = re.compile(_inline_pattern % {"roles": roles}, re.VERBOSE)
+        _inline_roles = dict(inline_handlers)
+        _inline_snapshot = list(inline_handlers)
+    return _inline_re, _inline_roles
+
+
 def _parse_interpreted(src):
     """
     Parse inline interpreted text.
@@ -325,21 +426,31 @@ def _parse_interpreted(src):
     allow application specific formatting of the enclosed strings. Such a
     construct is written as ":id:`text to format`" or "`text to format`:id:"
     where "id" is some sort of identifier used to specify how to format the
-    specified text.
+    specified text. Inline emphasis, strong emphasis and literals are handled
+    by the "emphasis", "strong" and "literal" roles. All constructs are
+    replaced in a single pass over the text.
     """
-    for h in inline_handlers:
-        def interpret(m):
-            return h[1](m.group(1))
-        src = re.sub(r":%s:`([\w ]+)`" % h[0], interpret, src)
-        src = re.sub(r"`([\w ]+)`:%s:" % h[0], interpret, src)
-    return src
+    inline_re, roles = _inline_table()
+
+    def interpret(m):
+        for role in ("literal", "strong", "emphasis"):
+            if m.group(role) is not None:
+                text = m.group(role)
+                break
+        else:
+            role = m.group("prefix_role") or m.group("suffix_role")
+            text = m.group("prefix_text") or m.group("suffix_text")
+        handler = roles.get(role)
+        return m.group(0) if handler is None else handler(text)
+
+    return inline_re.sub(interpret, src)
 
 
 def _parse_inline(src):
-    return _parse_interpreted(" ".join(l[1] for l in src).replace('``', '"'))
+    return _parse_interpreted(" ".join(l[1] for l in src))
 
 
-def parse_paragraph(src):
+def parse_paragraph(src, i):
     """
     Parse RST paragraph.
 
@@ -352,9 +463,9 @@ def parse_paragraph(src):
     well. This is handled transparently and requires no additional support from
     the caller.
     """
-    block, src = simple_block(src)
+    block, i = simple_block(src, i)
     if not block:
-        return False, None, src
+        return False, None, i
 
     para = _parse_inline(block)
     literal = None
@@ -365,21 +476,24 @@ def parse_paragraph(src):
             para = para[:-3]
         else:
             para = para[:-1]
-        literal, src = nested_block(src)
+        literal, i = nested_block(src, i)
 
     def literal_line(indent, l):
         return l[1] and "%s  %s%s" % (indent, l[0] * " ", l[1]) or ""
 
     def paragraph(width, indent, **kw):
-        result = []
         if para:
-            result.append(_wrap(para, width, indent))
+            for line in _wrap(para, width, indent).split("\n"):
+                yield line
         if literal:
-            literal_ = [literal_line(indent, l) for l in literal]
-            result.append("\n".join(literal_))
-        return "\n\n".join(result)
+            if para:
+                yield ""
+            for l in literal:
+                yield literal_line(indent, l)
+        if not (para or literal):
+            yield ""
 
-    return True, paragraph, src
+    return True, paragraph, i
 
 
 _transitions = [
@@ -394,6 +508,18 @@ _transitions = [
     parse_paragraph
 ]
 
+# Transitions to try by the first character of a line, built from
+# ``_transitions`` on demand and rebuilt whenever ``_transitions`` changes.
+_dispatch = {}
+_dispatched = []
+
+
+def _dispatch_table():
+    if _dispatched != _transitions:
+        _dispatched[:] = _transitions
+        _dispatch.clear()
+    return _dispatch
+
 
 def parse_body(src):
     """
@@ -403,24 +529,33 @@ def parse_body(src):
     Each block is parsed via a *transition* or *parse* function. Each *parse*
     function returns a 3-tuple of a boolean specifying if the block type
     matched the type parseable by the function, a new format function used to
-    generate the resulting formatted text, and the list of remaining RST lines
+    generate the resulting formatted text, and the index of the next RST line
     to be parsed.
 
     The *parse* functions are specified in the ``_transitions`` list. Each
-    function is tried in sequence on the current source input. If non of the
-    function where able to successfully match the current source, an exception
-    is raised. If a function does successfully match the input, then the
-    returned format function is appended to the list of blocks and the source
-    is again attempted to be parsed by starting at the begging of the
+    function that may match a line starting with the first character of the
+    current line is tried in sequence on the current source input. If non of
+    the function where able to successfully match the current source, an
+    exception is raised. If a function does successfully match the input, then
+    the returned format function is appended to the list of blocks and the
+    source is again attempted to be parsed by starting at the begging of the
     ``_transitions`` list.
 
     This function may be called recursively via the *parse* functions in order
     to parse nested RST blocks of text.
     """
     blocks = []
-    while src:
-        for t in _transitions:
-            matched, block, src = t(src)
+    dispatch = _dispatch_table()
+    i, last = 0, len(src)
+    while i < last:
+        c = src[i][1][:1]
+        transitions = dispatch.get(c)
+        if transitions is None:
+            transitions = dispatch[c] = [
+                t for t in _transitions
+                if getattr(t, "first", None) is None or (c and c in t.first)]
+        for t in transitions:
+            matched, block, i = t(src, i)
             if matched:
                 if block:
                     blocks.append(block)
@@ -429,18 +564,26 @@ def parse_body(src):
             raise error.RSTParseError("invalid ReST source")
 
     def body(width, indent, **kw):
-        result = []
+        started = False
         for b in blocks:
-            block_ = b(width, indent, **kw)
-            if block_ is not None:
-                result.append(block_)
-        return "\n\n".join(result)
+            separate = started
+            for line in b(width, indent, **kw):
+                if separate:
+                    yield ""
+                    separate = False
+                started = True
+                yield line
+        if not started:
+            yield ""
 
     return body
 
 
-def format_rst(src, width=80, indent=None, **kw):
-    indent = indent or ""
+def _preprocess(src):
+    """
+    Pre-process RST source text into a list of [indentation, text] lines with
+    the indentation shared by all non-blank lines removed.
+    """
     lines = []
     for line in src.splitlines():
         line_ = line.lstrip()
@@ -453,8 +596,114 @@ def format_rst(src, width=80, indent=None, **kw):
         else:
             for l in lines:
                 l[0] = max(l[0] - shared_indent, 0)
-    rst = parse_body(lines)
-    return rst(width, indent, **kw)
+    return lines
+
+
+class Document(object):
+    """
+    A parsed RST document.
+
+    The document holds the format functions resulting from parsing the source
+    text and may be rendered any number of times at different widths,
+    indentations and sets of kept containers.
+    """
+    def __init__(self, body):
+        self._body = body
+
+    def lines(self, width=80, indent=None, **kw):
+        """ Generate the formatted lines of the document. """
+        return self._body(width, indent or "", **kw)
+
+    def render(self, width=80, indent=None, **kw):
+        return "\n".join(self.lines(width, indent, **kw))
+
+    def write(self, out, width=80, indent=None, **kw):
+        """
+        Write the formatted document to ``out`` line by line as it is
+        generated. ``out`` may be any object with a ``write`` method such as a
+        file or a ``Shell``.
+        """
+        for line in self.lines(width, indent, **kw):
+            out.write(line + "\n")
+
+
+# Maximum number of parsed documents kept in the ``parse`` cache.
+cache_size = 64
+
+_cache = collections.OrderedDict()
+
+
+def parse(src):
+    """
+    Parse RST source text into a ``Document``.
+
+    The most recently parsed ``cache_size`` documents are cached by source text
+    and returned again when the same text is parsed.
+    """
+    doc = _cache.pop(src, None)
+    if doc is None:
+        doc = Document(parse_body(_preprocess(src)))
+        while len(_cache) >= cache_size > 0:
+            _cache.popitem(last=False)
+    if cache_size > 0:
+        _cache[src] = doc
+    return doc
+
+
+def format_rst(src, width=80, indent=None, **kw):
+    return parse(src).render(width, indent, **kw)
+
+
+def _format_batch(batch):
+    """
+    Format a list of pre-processed RST sources (see ``_preprocess``) with the
+    same options. Run by the worker processes of ``format_many``.
+    """
+    sources, width, indent, kw = batch
+    return [Document(parse_body(lines)).render(width, indent, **kw)
+            for lines in sources]
+
+
+def format_many(docs, width=80, keep=None, indent=None, processes=None):
+    """
+    Format a sequence of RST sources and return the list of formatted texts in
+    the same order.
+
+    All documents are formatted with the same width, indentation and kept
+    containers (see ``format_rst``), sharing the compiled regular expressions,
+    text wrappers and wrapped text. Repeated sources are only formatted once.
+    The sources are parsed without going through the ``parse`` cache so that a
+    large set of documents does not flush it.
+
+    If ``processes`` is greater than 1 the documents are split into batches
+    formatted by a pool of that many worker processes. The sources are
+    pre-processed once up front and only the distinct ones are sent to the
+    workers. Starting the pool is only worth it for very large sets of
+    documents.
+    """
+    docs = list(docs)
+    kw = {"keep": keep}
+    unique = list(collections.OrderedDict.fromkeys(docs))
+    if not processes or processes < 2 or len(unique) < 2:
+        formatted = {}
+        for src in unique:
+            doc = _cache.get(src) or Document(parse_body(_preprocess(src)))
+            formatted[src] = doc.render(width, indent, **kw)
+        return [formatted[src] for src in docs]
+
+    import multiprocessing
+    sources = [_preprocess(src) for src in unique]
+    size = -(-len(sources) // (processes * 4))
+    batches = [(sources[i:i + size], width, indent, kw)
+               for i in xrange(0, len(sources), size)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(_format_batch, batches)
+    finally:
+        pool.close()
+        pool.join()
+    formatted = dict(zip(unique, (r for batch in results for r in batch)))
+    return [formatted[src] for src in docs]
 
 
 if __name__ == "__main__":
@@ -1,9 +1,15 @@
 # options.py
 
 
+import ast
+import bisect
 import coal
-import getopt
+import cPickle as pickle
+import hashlib
+import importlib
 import inspect
+import os
+import pkgutil
 import sys
 import util
 
@@ -24,7 +30,7 @@ class Opt(object):
     that are accepted by a ``Options`` object. These ``Opt`` objects are not
     part of a ``Options`` object but rather part of the class. The ``Opt``
     instances are used as factories to build the option handlers that are
-    associated with a ``Options`` instance.
+    associated with a ``Options`` class.
 
     Examples of valid options::
 
@@ -58,55 +64,61 @@ class Opt(object):
         self._args = args
         self._kw = kw
 
-    def build_handler(self, cmd):
-        return _OptHandler(cmd, *self._args, **self._kw)
+    def build_handler(self, cls):
+        return _OptHandler(cls, *self._args, **self._kw)
 
 
 class _OptHandler(object):
-    def __init__(self, cmd, long_, short_, help=None, store=None, handler=None,
+    def __init__(self, cls, long_, short_, help=None, store=None, handler=None,
                  tag=None, metavar=None):
         """
         Internal class used to associate a option action with a particular
-        ``Options`` instance.
+        ``Options`` class.
+
+        Handlers are built once per ``Options`` class and shared by all of its
+        instances; the instance the option applies to is passed in when the
+        handler is called.
         """
         if store and handler:
-            raise OptError('cannot specify \'store\' and \'handler\'')
+            raise OptionsError('cannot specify \'store\' and \'handler\'')
 
-        self._cmd = cmd
         self._long = long_
         self._short = short_
         self._help = help or '[no help text available]'
         self._tag = tag or ''
         self._metavar = metavar or 'VALUE'
         self._argreq = False
+        self._choices = None
 
         if store is None:
             # Use a command method to handling the option/flag.
-            fn = getattr(cmd, handler)
-            self._argreq = _getargspec(fn).args != 0
-            def handler(arg):
-                 fn(arg) if self._argreq else fn()
+            method = handler
+            self._argreq = len(_getargspec(getattr(cls, method)).args) > 1
+            def handler(cmd, arg):
+                fn = getattr(cmd, method)
+                fn(arg) if self._argreq else fn()
 
         elif isinstance(store, dict):
             # Enumerated option.
             self._argreq = True
-            def handler(arg):
+            self._choices = sorted(store)
+            def handler(cmd, arg):
                 try:
-                    self._cmd[self._long] = store[arg]
+                    cmd[self._long] = store[arg]
                 except KeyError as e:
                     raise ValueError(str(e))
 
         elif callable(store):
             # Option with a coercion function.
             self._argreq = True
-            def handler(arg):
-                self._cmd[self._long] = store(arg)
+            def handler(cmd, arg):
+                cmd[self._long] = store(arg)
 
         else:
             # Simple flag (no option argument).
             self._argreq = False
-            def handler(arg):
-                self._cmd[self._long] = store
+            def handler(cmd, arg):
+                cmd[self._long] = store
 
         self._handler = handler
 
@@ -121,16 +133,14 @@ class _OptHandler(object):
         return self._short or ''
 
     @property
-    def long_getopt(self):
-        """ Long option getopt parse string """
-        return '%s%s' % (self._long, self._argreq and '=' or '')
+    def arg_required(self):
+        """ ``True`` if the option requires an argument """
+        return self._argreq
 
     @property
-    def short_getopt(self):
-        """ Short option getopt parse string """
-        if not self._short:
-            return ''
-        return '%s%s' % (self._short, self._argreq and ':' or '')
+    def choices(self):
+        """ Sorted list of valid arguments of an enumerated option, or None """
+        return self._choices
 
     @property
     def help(self):
@@ -141,9 +151,350 @@ class _OptHandler(object):
                                 self._tag and '%s ' % self._tag)
         return flag, self._help
 
-    def __call__(self, arg):
-        """ Parse the provided option argument string """
-        return self._handler(arg)
+    def __call__(self, cmd, arg):
+        """ Parse the provided option argument string into ``cmd`` """
+        return self._handler(cmd, arg)
+
+
+class _OptTable(object):
+    """
+    Internal class holding the compiled options of an ``Options`` class.
+
+    The table is built once per class, the first time the class is
+    instantiated, and is shared by all instances of the class.
+    """
+    def __init__(self, cls):
+        options = util.accumulate_class_list(cls, 'opts')
+        self.handlers = [opt.build_handler(cls) for opt in options]
+        self.defaults = dict((h.long_opt, None) for h in self.handlers)
+        self.merged = {}
+
+
+class _MergedOptTable(object):
+    """
+    Internal class holding the option dispatch tables of a command chain.
+
+    When parsing the command line, a sub-command must be able to parse the
+    options belonging to it and any parent (sub)commands. To do this, the
+    options of each command in the chain, from the root command down to the
+    sub-command, are merged together into a single set of long and short
+    options. Any options flags in a sub-command that are also defined by a
+    parent command are overridden by the sub-command.
+
+    Both dispatch tables map an option name to the index of the command in the
+    chain the option belongs to and the option handler. Long options may be
+    abbreviated to any unique prefix; the ``prefixes`` table maps every prefix
+    to the full option name, or to ``None`` if the prefix is ambiguous.
+    """
+    def __init__(self, tables):
+        self.short_opts, self.long_opts = {}, {}
+        for level, table in enumerate(tables):
+            for opt in table.handlers:
+                if opt.short_opt:
+                    self.short_opts[opt.short_opt] = (level, opt)
+                self.long_opts[opt.long_opt] = (level, opt)
+
+        self.prefixes = {}
+        for name in self.long_opts:
+            for i in xrange(1, len(name)):
+                prefix = name[:i]
+                if prefix in self.prefixes and self.prefixes[prefix] != name:
+                    self.prefixes[prefix] = None
+                else:
+                    self.prefixes[prefix] = name
+        for name in self.long_opts:
+            self.prefixes[name] = name
+
+    def parse_option(self, chain, args, i, calls):
+        """
+        Parse the option at ``args[i]`` and queue its handlers.
+
+        Handles long options with their argument attached (``--opt=value``) or
+        as the next argument, and groups of short options where the argument of
+        the last option may be attached (``-abvalue``) or the next argument.
+        A ``(command, handler, flag, argument)`` tuple is appended to ``calls``
+        for each option, to be run with ``dispatch``. Returns the index of the
+        next unparsed argument.
+        """
+        arg = args[i]
+        i += 1
+        if arg[1] == '-':
+            name, eq, value = arg[2:].partition('=')
+            if name not in self.prefixes:
+                raise OptionsError('option --%s not recognized' % name)
+            long_ = self.prefixes[name]
+            if long_ is None:
+                raise OptionsError('option --%s not a unique prefix' % name)
+            level, opt = self.long_opts[long_]
+            if opt.arg_required:
+                if not eq:
+                    if i >= len(args):
+                        raise OptionsError(
+                            'option --%s requires argument' % long_)
+                    value, i = args[i], i + 1
+            elif eq:
+                raise OptionsError(
+                    'option --%s must not have an argument' % long_)
+            calls.append((chain[level], opt, '--%s' % long_, value))
+            return i
+
+        for j in xrange(1, len(arg)):
+            short_ = arg[j]
+            try:
+                level, opt = self.short_opts[short_]
+            except KeyError:
+                raise OptionsError('option -%s not recognized' % short_)
+            if opt.arg_required:
+                value = arg[j + 1:]
+                if not value:
+                    if i >= len(args):
+                        raise OptionsError(
+                            'option -%s requires argument' % short_)
+                    value, i = args[i], i + 1
+                calls.append((chain[level], opt, '-%s' % short_, value))
+                break
+            calls.append((chain[level], opt, '-%s' % short_, ''))
+        return i
+
+    @staticmethod
+    def dispatch(cmd, opt, flag, arg):
+        """ Run an option handler queued by ``parse_option``. """
+        try:
+            opt(cmd, arg)
+        except ValueError as e:
+            raise OptionsError(
+                'invalid argument to option %s: %s' % (flag, arg))
+
+
+class LazyCmd(object):
+    """
+    Represents a sub-command class that is only imported when first used.
+
+    A ``LazyCmd`` may be used in place of a sub-command class in the ``cmds``
+    table of an ``Options`` class. The class is specified as a
+    ``"module:Class"`` string or as a loader function returning the class,
+    and is only loaded when the sub-command is selected. Plain
+    ``"module:Class"`` strings in the ``cmds`` table are treated as a
+    ``LazyCmd`` without a description.
+
+    Example::
+
+        class MyOptions(Options):
+            cmds = {
+                'build':LazyCmd('myapp.build:BuildOptions',
+                                'build the project'),
+                'clean':'myapp.clean:CleanOptions' }
+
+    The short description used in the help of the parent command is, in order
+    of preference, the ``desc`` given to the ``LazyCmd``, the ``desc`` string
+    literal assigned in the body of the class, read from the module source
+    without importing it, or the ``desc`` of the imported class. Classes given
+    by a loader function, or whose ``desc`` is inherited or computed, are thus
+    imported to list them.
+
+    Loading a class that cannot be imported raises an ``OptionsError``.
+    """
+    def __init__(self, spec, desc=None):
+        self.spec = spec
+        self.desc = desc
+        self._cls = None
+
+    def load(self):
+        """ Import and return the sub-command class. """
+        if self._cls is None:
+            try:
+                if callable(self.spec):
+                    self._cls = self.spec()
+                else:
+                    module, _, name = self.spec.partition(':')
+                    self._cls = getattr(importlib.import_module(module), name)
+            except (ImportError, AttributeError) as e:
+                raise OptionsError('cannot load command %s: %s' %
+                                   (self._name(), e))
+        return self._cls
+
+    def _name(self):
+        if callable(self.spec):
+            return getattr(self.spec, '__name__', repr(self.spec))
+        return self.spec
+
+    def source(self):
+        """
+        Return the source file of the sub-command class and its mtime. The
+        module of a ``"module:Class"`` string is located without importing it.
+        """
+        if callable(self.spec):
+            return _source_mtime(self.load())
+        return _file_mtime(_module_file(self.spec.partition(':')[0]))
+
+    def short_desc(self):
+        if self.desc is not None:
+            return self.desc.lstrip().split('\n', 1)[0]
+        if self._cls is None and not callable(self.spec):
+            module, _, name = self.spec.partition(':')
+            desc = _class_descs(_module_file(module)).get(name)
+            if desc is not None:
+                return desc.lstrip().split('\n', 1)[0]
+        return self.load().short_desc()
+
+    def __call__(self, *args, **kw):
+        """ Load the sub-command class and create an instance of it. """
+        return self.load()(*args, **kw)
+
+
+_help_cache = {}
+
+# Index of the literal ``desc`` strings of the classes of module source files,
+# keyed by file name and mtime.
+_desc_index = {}
+
+
+def _file_mtime(fname):
+    """ Return a source file name and its mtime, ``None`` if not found. """
+    if not fname:
+        return None, None
+    if fname[-4:] in ('.pyc', '.pyo') and os.path.exists(fname[:-1]):
+        fname = fname[:-1]
+    try:
+        return fname, os.stat(fname).st_mtime
+    except OSError:
+        return fname, None
+
+
+def _source_mtime(cls):
+    """ Return the source file and its mtime of the module defining ``cls``. """
+    return _file_mtime(
+        getattr(sys.modules.get(cls.__module__), '__file__', None))
+
+
+def _module_file(module):
+    """
+    Return the file name of a module without importing it (its parent packages
+    are imported though), ``None`` if it cannot be found.
+    """
+    mod = sys.modules.get(module)
+    if mod is not None:
+        return getattr(mod, '__file__', None)
+    try:
+        loader = pkgutil.get_loader(module)
+    except ImportError:
+        return None
+    if loader is None or not hasattr(loader, 'get_filename'):
+        return None
+    return loader.get_filename(module)
+
+
+def _class_descs(fname):
+    """
+    Return the ``desc`` string literals assigned in the body of the top-level
+    classes of a module source file, indexed by class name.
+    """
+    fname, mtime = _file_mtime(fname)
+    if mtime is None or not fname.endswith('.py'):
+        return {}
+    descs = _desc_index.get((fname, mtime))
+    if descs is None:
+        descs = {}
+        try:
+            with open(fname, 'r') as f:
+                tree = ast.parse(f.read(), fname)
+        except (IOError, SyntaxError):
+            tree = ast.Module(body=[])
+        for node in tree.body:
+            if not isinstance(node, ast.ClassDef):
+                continue
+            for stmt in node.body:
+                if (isinstance(stmt, ast.Assign) and
+                        isinstance(stmt.value, ast.Str) and
+                        any(isinstance(t, ast.Name) and t.id == 'desc'
+                            for t in stmt.targets)):
+                    descs[node.name] = stmt.value.s
+        _desc_index[(fname, mtime)] = descs
+    return descs
+
+
+def _distance(a, b, limit):
+    """
+    Return the Levenshtein edit distance between two strings.
+
+    The computation stops early once the distance is known to exceed
+    ``limit``, in which case ``limit + 1`` is returned.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev = range(len(b) + 1)
+    for i, ca in enumerate(a):
+        cur = [i + 1]
+        for j, cb in enumerate(b):
+            cur.append(min(prev[j + 1] + 1, cur[j] + 1, prev[j] + (ca != cb)))
+        if min(cur) > limit:
+            return limit + 1
+        prev = cur
+    return prev[-1]
+
+
+class _CmdIndex(object):
+    """
+    Internal class indexing the sub-command table of an ``Options`` class.
+
+    Maps every alias to its command table key and list of aliases, keeps a
+    sorted alias list for unique prefix resolution and buckets the aliases by
+    length so that only aliases of a similar length are compared when looking
+    for suggestions. The ``entries`` table maps each command table key to the
+    command class, with ``"module:Class"`` strings wrapped in a ``LazyCmd``.
+    """
+    def __init__(self, cmdtable):
+        self.cmdtable = cmdtable
+        self.entries = {}
+        self.aliases = {}
+        self.lengths = {}
+        for key, cmd in cmdtable.iteritems():
+            if isinstance(cmd, basestring):
+                cmd = LazyCmd(cmd)
+            self.entries[key] = cmd
+            aliases = key.split('|')
+            for alias in aliases:
+                self.aliases[alias] = (key, aliases)
+                self.lengths.setdefault(len(alias), []).append(alias)
+        self.sorted = sorted(self.aliases)
+
+    def find(self, cmdname):
+        """
+        Resolve a command name, or unique prefix of one, to an alias.
+
+        Returns ``None`` if no alias matches and raises an ``OptionsError`` if
+        the prefix matches the aliases of more than one command.
+        """
+        if cmdname in self.aliases:
+            return cmdname
+        if not cmdname:
+            return None
+        i = bisect.bisect_left(self.sorted, cmdname)
+        matches = []
+        while i < len(self.sorted) and self.sorted[i].startswith(cmdname):
+            matches.append(self.sorted[i])
+            i += 1
+        keys = set(self.aliases[m][0] for m in matches)
+        if len(keys) > 1:
+            raise OptionsError('command %s is ambiguous: %s' %
+                               (cmdname, ' '.join(matches)))
+        return matches and matches[0] or None
+
+    def suggest(self, cmdname, count=3):
+        """
+        Return up to ``count`` aliases close to an unknown command name.
+
+        An alias is only suggested if some of it is left unchanged, so that
+        short names are not suggested for any short typo.
+        """
+        limit = max(1, len(cmdname) // 3)
+        found = []
+        for length in xrange(len(cmdname) - limit, len(cmdname) + limit + 1):
+            for alias in self.lengths.get(length, ()):
+                dist = _distance(cmdname, alias, limit)
+                if dist <= limit and dist < min(len(cmdname), len(alias)):
+                    found.append((dist, alias))
+        return [alias for dist, alias in sorted(found)[:count]]
 
 
 class Options(object):
@@ -228,10 +579,13 @@ class Options(object):
     ''cmds''
         Dictionary mapping sub-command names with their associated ``Options``
         sub-classes. Each command name (key to the dictionary) is a list of
-        aliases separated by the ''|'' character.
+        aliases separated by the ''|'' character. A sub-class may be given as a
+        ``LazyCmd`` or ``"module:Class"`` string to defer importing it until
+        the sub-command is used.
     """
 
     desc = '[no help text available]'
+    help_cache_dir = None
 
     def __init__(self, parent=None, ui=None, name=None, aliases=None):
         self.subcmd = None
@@ -239,14 +593,10 @@ class Options(object):
         self._parent = parent
         self._cmdname = name
         self._cmdaliases = aliases or []
-        self._handlers = []
-        self._options = {}
 
-        options = util.accumulate_class_list(self.__class__, 'opts')
-        for opt in options:
-            handler = opt.build_handler(self)
-            self._handlers.append(handler)
-            self._options[handler.long_opt] = None
+        table = self._opttable()
+        self._handlers = table.handlers
+        self._options = table.defaults.copy()
 
     def __getitem__(self, key):
         """ Get an options value """
@@ -282,15 +632,37 @@ class Options(object):
         Create a ``Options`` object for the specified sub-command.
 
         If the specified sub-command is not found, then ``None`` is returned.
-        The ``Options`` object's sub-command table is searched for the
-        associated command class. Each entry in the command table dictionary
-        is a key with a list of aliases separated by ''|'' characters and the
-        command class used to parse options.
+        Each entry in the command table dictionary is a key with a list of
+        aliases separated by ''|'' characters and the command class used to
+        parse options. The sub-command may be given as any alias or as a
+        unique prefix of the aliases of one command; an ``OptionsError`` is
+        raised if the prefix is ambiguous.
+        """
+        index = self._cmdindex()
+        alias = index.find(cmdname)
+        if alias is None:
+            return None
+        key, aliases = index.aliases[alias]
+        return index.entries[key](self, ui=self.ui, name=alias, aliases=aliases)
+
+    def suggestcmds(self, cmdname):
+        """ Return a list of sub-command names similar to ``cmdname``. """
+        return self._cmdindex().suggest(cmdname)
+
+    def _cmdindex(self):
         """
-        for cmd, cls in self.cmdtable.iteritems():
-            aliases = cmd.split('|')
-            if cmdname in aliases:
-                return cls(self, ui=self.ui, name=cmdname, aliases=aliases)
+        The index of the sub-command table.
+
+        The index is built once and cached on the ``Options`` class. It is
+        rebuilt if the command table is replaced, but not if it is modified in
+        place.
+        """
+        cls = self.__class__
+        index = cls.__dict__.get('_cmdindex_')
+        if index is None or index.cmdtable is not self.cmdtable:
+            index = _CmdIndex(self.cmdtable)
+            cls._cmdindex_ = index
+        return index
 
     def parse(self, args=None):
         """
@@ -308,18 +680,11 @@ class Options(object):
         """
         if args is None:
             args = sys.argv[1:]
-        args = self._parse(args)
-        if args and self.cmdtable:
-            cmdname = args.pop(0)
-            self.subcmd = self.findcmd(cmdname)
-            if self.subcmd is None:
-                raise OptionsError('unknown command: %s' % cmdname)
-            self.subcmd.parse(args)
-        else:
-            try:
-                util.checksignature(self.parse_args, *args)
-            except SignatureError as e:
-                raise OptionsError('wrong number of arguments')
+        cmd, args = self._parse(args)
+        try:
+            util.checksignature(cmd.parse_args, *args)
+        except SignatureError as e:
+            raise OptionsError('wrong number of arguments')
         if not self._parent:
             self._post_options()
 
@@ -363,17 +728,36 @@ class Options(object):
         The above example shows the help generated for a command 'cmd' handled
         by the base command (or application) 'app'. The command 'cmd' also has a
         sub-command named 'sub-cmd'.
+
+        The rendered help is cached in memory per command chain, terminal
+        width and verbosity. If ``help_cache_dir`` is set, the rendered help is
+        also cached on disk in that directory and reused by later processes
+        for as long as the source files of the commands involved are unchanged.
         """
-        self.ui.write('usage: %s %s\n\n' % (self._parent_usage(), self.usage))
-        self.ui.write('%s\n\n' % self.short_desc())
+        key = self._help_key()
+        chunks = _help_cache.get(key)
+        if chunks is None:
+            chunks = self._load_help()
+            if chunks is None:
+                chunks = self._render_help()
+                self._store_help(chunks)
+            _help_cache[key] = chunks
+        for chunk in chunks:
+            self.ui.write(chunk)
+
+    def _render_help(self):
+        """ Render the help output into a list of strings to write. """
+        out = []
+        out.append('usage: %s %s\n\n' % (self._parent_usage(), self.usage))
+        out.append('%s\n\n' % self.short_desc())
         long_desc = self.long_desc()
         if long_desc:
             long_desc = self.ui.rst(long_desc, indent='    ')
             if long_desc:
-                self.ui.write('%s\n\n' % long_desc)
+                out.append('%s\n\n' % long_desc)
 
         cmds = {}
-        for name, cmd in self.cmdtable.iteritems():
+        for name, cmd in self._cmdindex().entries.iteritems():
             name = '    %s  ' % name.split('|')[0]
             cmds[name] = cmd.short_desc()
 
@@ -383,19 +767,93 @@ class Options(object):
 
         if cmds:
             groups.append(('commands', cmds))
-            indent = max(len(c[0]) for c in cmds)
+            indent = max(util.display_width(c[0]) for c in cmds)
 
         indent_, groups_ = self._option_help()
 
         groups.extend(groups_)
         indent = max(indent, indent_)
         hanging = indent * ' '
+        width = self.ui.termwidth()
         for group in groups:
-            self.ui.write('%s:\n\n' % group[0])
+            out.append('%s:\n\n' % group[0])
             for opt in group[1]:
-                self.ui.write('%s\n' % util.wrap(
-                    opt[1], self.ui.termwidth(), opt[0].ljust(indent), hanging))
-            self.ui.write('\n')
+                out.append('%s\n' % util.wrap(
+                    opt[1], width, util.ljust(opt[0], indent), hanging))
+            out.append('\n')
+        return out
+
+    def _chain(self):
+        """ Return the list of commands from the root command to this one. """
+        chain = [self]
+        while chain[0]._parent:
+            chain.insert(0, chain[0]._parent)
+        return chain
+
+    def _help_key(self):
+        """ The in-memory help cache key of this command. """
+        chain = tuple((cmd.__class__, cmd._cmdname) for cmd in self._chain())
+        return (chain, self.ui.__class__, self.ui.termwidth(),
+                bool(self.ui.verbose))
+
+    def _help_file(self):
+        """
+        Return the on-disk help cache file and the source files it depends on.
+
+        The sources are the modules defining the commands in the chain, their
+        base classes and the sub-command classes, plus the ``minirst`` and
+        ``util`` modules that render it. The modules of lazy sub-commands are
+        located without importing them, so that the sources are the same
+        whether or not rendering the help imported them.
+        """
+        classes = set()
+        for cmd in self._chain():
+            classes.update(inspect.getmro(cmd.__class__))
+        sources = set(_source_mtime(cls) for cls in classes
+                      if cls is not object)
+        for cmd in self._cmdindex().entries.itervalues():
+            if isinstance(cmd, LazyCmd):
+                sources.add(cmd.source())
+            else:
+                sources.add(_source_mtime(cmd))
+        coaldir = os.path.dirname(os.path.abspath(__file__))
+        sources.update(_file_mtime(os.path.join(coaldir, name))
+                       for name in ('minirst.py', 'util.py'))
+        sources = sorted(sources)
+        chain = ['%s.%s:%s' % (cmd.__class__.__module__,
+                               cmd.__class__.__name__, cmd._cmdname)
+                 for cmd in self._chain()]
+        key = repr((chain, self.ui.__class__.__name__, self.ui.termwidth(),
+                    bool(self.ui.verbose)))
+        fname = os.path.join(self.help_cache_dir,
+                             '%s.help' % hashlib.sha1(key).hexdigest())
+        return fname, sources
+
+    def _load_help(self):
+        """ Load the rendered help from the on-disk cache if still valid. """
+        if not self.help_cache_dir:
+            return None
+        fname, sources = self._help_file()
+        try:
+            with open(fname, 'rb') as f:
+                sources_, chunks = pickle.load(f)
+        except Exception:
+            return None
+        if sources_ != sources or None in (s[1] for s in sources):
+            return None
+        return chunks
+
+    def _store_help(self, chunks):
+        """ Store the rendered help in the on-disk cache, if enabled. """
+        if not self.help_cache_dir:
+            return
+        fname, sources = self._help_file()
+        try:
+            util.mkdir(self.help_cache_dir)
+            with open(fname, 'wb') as f:
+                pickle.dump((sources, chunks), f, pickle.HIGHEST_PROTOCOL)
+        except (IOError, OSError):
+            pass
 
     def _option_help(self):
         """
@@ -408,7 +866,7 @@ class Options(object):
         opts = [h.help for h in self._handlers]
         if opts:
             groups = [('%s options' % self._cmdname, opts)]
-            width = max(len(o[0]) for o in opts)
+            width = max(util.display_width(o[0]) for o in opts)
         else:
             groups = []
             width = 0
@@ -438,76 +896,84 @@ class Options(object):
             return '%s %s' % (self._parent._parent_usage(), self._cmdname)
         return self._cmdname
 
-    @property
-    def _merged_optlist(self):
+    @classmethod
+    def _opttable(cls):
+        """ The compiled option table of this ``Options`` class. """
+        table = cls.__dict__.get('_opttable_')
+        if table is None:
+            table = _OptTable(cls)
+            cls._opttable_ = table
+        return table
+
+    def _merged_opttable(self, chain):
         """
-        Builds complete list of short and long options.
+        Return the merged option table of a command chain.
 
-        When parsing the command line, a sub-command must be able to parse the
-        options belonging to it and any parent (sub)commands. To do this, the
-        options of this ``Options`` and its parent must be merged together into
-        a single set of long and short options.
-
-        Any options flags in this sub-command that are also defined by the
-        parent ``Options`` object (and it's parent...) are overridden by this
-        sub-command.
+        The command chain is the list of ``Options`` instances from the root
+        command down to this command. The merged option table is cached per
+        combination of ``Options`` classes in the chain.
         """
-        if self._parent:
-            # Start with the parents short and long options.
-            short_opts, long_opts = self._parent._merged_optlist
-        else:
-            short_opts, long_opts = {}, {}
-
-        # Override any existing options with the sub-command versions.
-        for opt in self._handlers:
-            if opt.short_opt:
-                short_opts[opt.short_opt] = opt
-            long_opts[opt.long_opt] = opt
-
-        return short_opts, long_opts
+        key = tuple(cmd.__class__ for cmd in chain)
+        merged = self._opttable().merged
+        table = merged.get(key)
+        if table is None:
+            table = _MergedOptTable([cmd._opttable() for cmd in chain])
+            merged[key] = table
+        return table
 
     def _parse(self, args):
         """
-        Parses command line arguments using ``getopt``.
+        Parses command line arguments in a single pass.
 
-        Builds the ``getopt`` style short option string and long option list and
-        uses ``getopt` to parse the provided command line options. The
-        ``getopt`` short and long option configurations are built from the
-        merged option list for this ``Options`` instance. The corresponding
-        option handlers are then executed based on the specified options.
+        The arguments are walked once across the whole command and sub-command
+        chain. Options are looked up in the merged option table of the current
+        (sub-)command. Their handlers run in order once all the arguments have
+        been parsed, so that no handler runs for an invalid command line (as a
+        result, errors in option arguments detected by the handlers are only
+        reported after all other errors). A positional argument
+        to a command with a sub-command table selects the sub-command that
+        parses the remaining arguments; all other positional arguments are
+        collected for the last sub-command. The argument ``--`` ends option
+        parsing up to the next sub-command name.
+
+        Returns the last sub-command and its list of positional arguments.
 
         A ``OptionsError`` will be raised in the event of an error parsing
-        either an invalid option or flag, or failing to parse an invalid option
-        argument.
+        either an invalid option or flag, failing to parse an invalid option
+        argument or an unknown sub-command.
         """
-        long_getopts = []
-        short_getopts = []
-
-        # Build the getopt short and long option string and list.
-        short_, long_ = self._merged_optlist
-        for opt, handler in long_.iteritems():
-            long_getopts.append(handler.long_getopt)
-        for opt, handler in short_.iteritems():
-            short_getopts.append(handler.short_getopt)
-            
-        # Build the option-to-handler map.
-        long_.update(short_)
-
-        try:
-            # Parse the command line argumenst.
-            _getopt = self.cmdtable and getopt.getopt or getopt.gnu_getopt
-            opts, args = _getopt(args, ''.join(short_getopts), long_getopts)
-        except getopt.GetoptError as e:
-            raise OptionsError(str(e))
-
-        # Run option actions.
-        for opt, arg in opts:
-            key = opt[2:] if opt[1] == '-' else opt[1:]
-            try:
-                long_[key](arg)
-            except ValueError as e:
-                raise OptionsError(
-                    'invalid argument to option %s: %s' % (opt, arg))
-
-        return args
-
+        chain = self._chain()
+        cmd, table = self, self._merged_opttable(chain)
+
+        positional = []
+        calls = []
+        options = True
+        i, n = 0, len(args)
+        while i < n:
+            arg = args[i]
+            if options and arg[:1] == '-' and arg != '-':
+                if arg == '--':
+                    options = False
+                    i += 1
+                else:
+                    i = table.parse_option(chain, args, i, calls)
+                continue
+            i += 1
+            if cmd.cmdtable:
+                subcmd = cmd.findcmd(arg)
+                if subcmd is None:
+                    similar = cmd.suggestcmds(arg)
+                    raise OptionsError('unknown command: %s%s' % (arg,
+                        similar and ' (did you mean %s?)' %
+                        ' or '.join(similar) or ''))
+                cmd.subcmd = subcmd
+                cmd = subcmd
+                chain.append(cmd)
+                table = cmd._merged_opttable(chain)
+                options = True
+            else:
+                positional.append(arg)
+
+        for call in calls:
+            table.dispatch(*call)
+        return cmd, positional
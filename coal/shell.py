@@ -4,9 +4,168 @@
 import difflib
 import minirst
 import sys
+import time
 import util
 
 
+def _myers(a, b, alo, ahi, blo, bhi, maxd):
+    """
+    Find the matching blocks between two ranges of hashed lines.
+
+    Implements the greedy Myers O(ND) difference algorithm. The trace of the
+    furthest reaching paths is kept only for the diagonals touched by each
+    edit step so memory stays proportional to the edit distance. If the edit
+    distance exceeds ``maxd``, ``None`` is returned and the caller is expected
+    to treat the whole range as replaced.
+    """
+    n, m = ahi - alo, bhi - blo
+    limit = n + m
+    if maxd is not None:
+        limit = min(limit, maxd)
+    off = limit + 1
+    v = [0] * (2 * limit + 3)
+    trace = []
+    for d in xrange(limit + 1):
+        for k in xrange(-d, d + 1, 2):
+            if k == -d or (k != d and v[off + k - 1] < v[off + k + 1]):
+                x = v[off + k + 1]
+            else:
+                x = v[off + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            v[off + k] = x
+            if x >= n and y >= m:
+                return _myers_blocks(trace, d, n, m, alo, blo)
+        trace.append(v[off - d:off + d + 1])
+    return None
+
+
+def _myers_blocks(trace, d, x, y, alo, blo):
+    """ Walk the Myers trace backwards collecting the matching blocks. """
+    blocks = []
+    while d > 0:
+        vd = trace[d - 1]
+        k = x - y
+        if k == -d or (k != d and vd[k - 1 + d - 1] < vd[k + 1 + d - 1]):
+            pk = k + 1
+        else:
+            pk = k - 1
+        px = vd[pk + d - 1]
+        py = px - pk
+        sx = px if pk == k + 1 else px + 1
+        if x > sx:
+            blocks.append((alo + sx, blo + sx - k, x - sx))
+        x, y, d = px, py, d - 1
+    if x > 0:
+        blocks.append((alo, blo, x))
+    blocks.reverse()
+    return blocks
+
+
+def matching_blocks(a, b, maxd=None):
+    """
+    Return the list of matching blocks between two sequences of lines.
+
+    Lines are hashed to integers before comparison and any common prefix and
+    suffix is stripped before the Myers algorithm is run on the remainder. The
+    result is in the same form as ``difflib.SequenceMatcher`` produces: a list
+    of ``(i, j, n)`` triples terminated by ``(len(a), len(b), 0)``.
+
+    :Parameters:
+      - `a`: The list of "left" lines
+      - `b`: The list of "right" lines
+      - `maxd`: The maximum edit distance to search for before giving up and
+           treating the differing middle of the sequences as replaced
+    """
+    ids = {}
+    a_ = [ids.setdefault(l, len(ids)) for l in a]
+    b_ = [ids.setdefault(l, len(ids)) for l in b]
+
+    alo, blo, ahi, bhi = 0, 0, len(a_), len(b_)
+    while alo < ahi and blo < bhi and a_[alo] == b_[blo]:
+        alo, blo = alo + 1, blo + 1
+    while ahi > alo and bhi > blo and a_[ahi - 1] == b_[bhi - 1]:
+        ahi, bhi = ahi - 1, bhi - 1
+
+    blocks = []
+    if alo:
+        blocks.append((0, 0, alo))
+    middle = _myers(a_, b_, alo, ahi, blo, bhi, maxd)
+    if middle:
+        blocks.extend(middle)
+    if ahi < len(a_):
+        blocks.append((ahi, bhi, len(a_) - ahi))
+
+    # Merge adjacent blocks to match the output of difflib.
+    merged = []
+    for i, j, n in blocks:
+        if merged and merged[-1][0] + merged[-1][2] == i and \
+                merged[-1][1] + merged[-1][2] == j:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + n)
+        else:
+            merged.append((i, j, n))
+    merged.append((len(a_), len(b_), 0))
+    return merged
+
+
+class _Matcher(difflib.SequenceMatcher):
+    """
+    ``difflib.SequenceMatcher`` driven by pre-computed matching blocks.
+
+    Only the opcode generation and grouping of ``difflib`` is reused; the
+    expensive longest-match search is replaced by ``matching_blocks``.
+    """
+    def __init__(self, a, b, maxd=None):
+        self.a, self.b = a, b
+        self.matching_blocks = matching_blocks(a, b, maxd)
+        self.opcodes = None
+
+    def get_matching_blocks(self):
+        return self.matching_blocks
+
+
+def _format_range(start, stop):
+    """ Format a unified diff hunk range the same way ``difflib`` does. """
+    beginning, length = start + 1, stop - start
+    if length == 1:
+        return "%d" % beginning
+    if not length:
+        beginning -= 1
+    return "%d,%d" % (beginning, length)
+
+
+def unified_diff(a, b, fromfile="", tofile="", n=3, maxd=None):
+    """
+    Generate a unified diff between two lists of lines.
+
+    The output is identical in format to ``difflib.unified_diff`` but the
+    differences are found with ``matching_blocks`` which scales to very large
+    inputs.
+    """
+    started = False
+    for group in _Matcher(a, b, maxd).get_grouped_opcodes(n):
+        if not started:
+            started = True
+            yield "--- %s\n" % fromfile
+            yield "+++ %s\n" % tofile
+        first, last = group[0], group[-1]
+        yield "@@ -%s +%s @@\n" % (_format_range(first[1], last[2]),
+                                   _format_range(first[3], last[4]))
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                for line in a[i1:i2]:
+                    yield " " + line
+                continue
+            if tag in ("replace", "delete"):
+                for line in a[i1:i2]:
+                    yield "-" + line
+            if tag in ("replace", "insert"):
+                for line in b[j1:j2]:
+                    yield "+" + line
+
+
 class Shell(object):
     def __init__(self, stdin=None, stdout=None, stderr=None):
         self.stdin = stdin or sys.stdin
@@ -20,6 +179,19 @@ class Shell(object):
         self._indent = ""
         self.width = None
 
+        self.diff_limit = None
+        self.diff_maxd = 2000
+
+        self.buffer_size = None
+        self.buffer_lines = None
+        self.buffer_interval = None
+
+        self._buffer = []
+        self._buffer_len = 0
+        self._buffer_nl = 0
+        self._flushed = time.time()
+        self._progress = 0
+
     def termwidth(self):
         return self.width or util.termwidth()
 
@@ -32,6 +204,95 @@ class Shell(object):
                 self._indent = old_indent
         return context()
 
+    @property
+    def buffering(self):
+        """ ``True`` if any of the stdout buffer flush limits are set. """
+        return (self.buffer_size is not None or
+                self.buffer_lines is not None or
+                self.buffer_interval is not None)
+
+    def buffered(self, size=8192, lines=None, interval=None):
+        """
+        Buffer all output written to stdout within a context.
+
+        Output written via ``write`` is collected in an internal buffer and
+        written to the stdout stream as a single string when the buffer holds at
+        least ``size`` characters, ``lines`` newlines, or when ``interval``
+        seconds have passed since the last flush; any limit set to ``None`` is
+        ignored. The buffer is always flushed on exit from the context, before
+        prompting for input and before writing to stderr.
+
+        The same flush policy may be enabled permanently by setting the
+        ``buffer_size``, ``buffer_lines`` and ``buffer_interval`` attributes, in
+        which case the caller is responsible for calling ``flush``.
+        """
+        old_limits = (self.buffer_size, self.buffer_lines, self.buffer_interval)
+        class context(object):
+            def __enter__(self_):
+                self.buffer_size = size
+                self.buffer_lines = lines
+                self.buffer_interval = interval
+                self._flushed = time.time()
+            def __exit__(self_, exc_type, exc_value, exc_tb):
+                self.flush()
+                self.buffer_size, self.buffer_lines, self.buffer_interval = \
+                        old_limits
+        return context()
+
+    def flush(self):
+        """ Write any buffered output to the stdout stream and flush it. """
+        if self._buffer:
+            data = "".join(self._buffer)
+            self._buffer = []
+            self._buffer_len = 0
+            self._buffer_nl = 0
+            self.stdout.write(data)
+        self._flushed = time.time()
+        flush = getattr(self.stdout, "flush", None)
+        if flush:
+            flush()
+
+    def isatty(self):
+        """ ``True`` if the stdout stream is connected to a terminal. """
+        isatty = getattr(self.stdout, "isatty", None)
+        return bool(isatty and isatty())
+
+    def progress(self, msg):
+        """
+        Show a transient, single line progress message.
+
+        The progress line is only shown if stdout is a terminal and ``quiet`` is
+        ``False``. Each call overwrites the previous progress line in place and
+        the next regular write to stdout or stderr clears it.
+        """
+        if self.quiet or not self.isatty():
+            return
+        width = util.display_width(msg)
+        pad = max(self._progress - width, 0) * " "
+        self._progress = 0
+        self._write_out("\r%s%s" % (msg, pad))
+        self._progress = width
+        self.flush()
+
+    def _write_out(self, data):
+        """ Write to stdout, honoring the buffer flush limits. """
+        if self._progress:
+            data = "\r%s\r%s" % (self._progress * " ", data)
+            self._progress = 0
+        if not self.buffering:
+            self.stdout.write(data)
+            return
+        self._buffer.append(data)
+        self._buffer_len += len(data)
+        self._buffer_nl += data.count("\n")
+        if ((self.buffer_size is not None and
+                self._buffer_len >= self.buffer_size) or
+            (self.buffer_lines is not None and
+                self._buffer_nl >= self.buffer_lines) or
+            (self.buffer_interval is not None and
+                time.time() - self._flushed >= self.buffer_interval)):
+            self.flush()
+
     def write(self, msg, **opts):
         """
         Write a message to the registered standard output stream.
@@ -45,7 +306,7 @@ class Shell(object):
         to add their own keywords that. Again, see the ``ColorShell`` class as
         an example.
         """
-        self.stdout.write("%s%s" % (self._indent, msg))
+        self._write_out("%s%s" % (self._indent, msg))
 
     def write_err(self, msg, **opts):
         """
@@ -55,6 +316,10 @@ class Shell(object):
         written to the standard error stream. All error messages eventually will
         be passed to ``write_err``.
         """
+        if self._progress:
+            self._write_out("")
+        if self._buffer:
+            self.flush()
         self.stderr.write("%s%s" % (self._indent, msg))
 
     def prompt(self, prompt=None, default=None):
@@ -106,28 +371,65 @@ class Shell(object):
         ``True``, then the container *verbose* is added automatically to the
         array of containers to keep.
         """
+        return minirst.format_rst(txt, width=(width or self.termwidth() - 2),
+                                  indent=indent, keep=self._rst_keep(keep))
+
+    def write_rst(self, txt, width=None, indent="", keep=None):
+        """
+        Format restructured text source and write it to the output stream.
+
+        The formatted text is written line by line as it is generated rather
+        than being formatted into a single string first. The arguments are the
+        same as for the ``rst`` method.
+        """
+        doc = minirst.parse(txt)
+        doc.write(self, width=(width or self.termwidth() - 2), indent=indent,
+                  keep=self._rst_keep(keep))
+
+    def _rst_keep(self, keep):
         keep = keep or []
         if self.verbose and "verbose" not in keep:
             keep.append("verbose")
-        return minirst.format_rst(txt, width=(width or self.termwidth() - 2),
-                                  indent=indent, keep=keep)
+        return keep
 
     def _input(self, prompt=None):
         if prompt is not None:
             self.write(prompt)
+        if self.buffering:
+            self.flush()
         return self.stdin.readline().strip()
 
     def _diff(self, left, right, lname=None, rname=None):
+        """
+        Generate the lines of a unified diff between two strings.
+
+        If ``diff_limit`` is set, at most that many diff lines are generated
+        followed by a single line summarizing the lines not shown. The search
+        for differences gives up after ``diff_maxd`` edits, in which case the
+        differing middle of the inputs is shown as replaced.
+        """
         left = left.splitlines(True)
         lname = lname or "left"
 
         right = right.splitlines(True)
         rname = rname or "right"
 
-        for l in difflib.unified_diff(left, right, lname, rname):
+        count, added, removed = 0, 0, 0
+        for l in unified_diff(left, right, lname, rname, maxd=self.diff_maxd):
+            if self.diff_limit is not None and count >= self.diff_limit:
+                if l.startswith("+") and not l.startswith("+++"):
+                    added += 1
+                elif l.startswith("-") and not l.startswith("---"):
+                    removed += 1
+                count += 1
+                continue
             if not l.endswith("\n"):
                 l = l + "\n"
+            count += 1
             yield l
+        if self.diff_limit is not None and count > self.diff_limit:
+            yield "... %d more lines not shown (%d added, %d removed)\n" % (
+                    count - self.diff_limit, added, removed)
 
 
 class ColorShell(Shell):
@@ -137,11 +439,15 @@ class ColorShell(Shell):
     """
     def write(self, msg, **opts):
         color = opts.pop("color", None)
-        Shell.write(self, util.colorize(msg, color=color), **opts)
+        if color:
+            msg = util.colorize(msg, color)
+        Shell.write(self, msg, **opts)
 
     def write_err(self, msg, **opts):
         color = opts.pop("color", None)
-        Shell.write_err(self, util.colorize(msg, color=color), **opts)
+        if color:
+            msg = util.colorize(msg, color)
+        Shell.write_err(self, msg, **opts)
 
     def diff(self, left, right, lname=None, rname=None):
         for l in self._diff(left, right, lname, rname):
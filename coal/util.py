@@ -1,10 +1,11 @@
 # util.py
 
 import os
+import re
 import struct
 import sys
-import textwrap
 import traceback
+import unicodedata
 
 import error
 
@@ -54,7 +55,205 @@ def accumulate_class_list(cls, attr):
     return list_
 
 
-def wrap(s, width, indent="", subindent=""):
+_ansi_re = re.compile(r"\033\[[0-?]*[ -/]*[@-~]")
+_nonascii_search = re.compile(r"[^\x20-\x7e]").search
+_nontext_search = re.compile(r"[^\t\n\x0b\x0c\r\x20-\x7e]").search
+
+_char_widths = {}
+_widths = {}
+_widths_size = 4096
+
+
+def _char_width(c):
+    """ Return the number of terminal columns taken by a unicode character. """
+    w = _char_widths.get(c)
+    if w is None:
+        cp = ord(c)
+        if (cp < 0x20 or 0x7f <= cp < 0xa0 or unicodedata.combining(c) or
+                unicodedata.category(c) in ("Mn", "Me", "Cf")):
+            w = 0
+        elif (unicodedata.east_asian_width(c) in ("W", "F") or
+                0x1f300 <= cp <= 0x1faff):
+            w = 2
+        else:
+            w = 1
+        _char_widths[c] = w
+    return w
+
+
+def display_width(s):
+    """
+    Return the number of terminal columns a string takes when displayed.
+
+    East Asian wide and full-width characters take two columns, while combining
+    and other zero-width characters, control characters and ANSI escape
+    sequences (such as those added by ``colorize``) take none. Byte strings are
+    taken to be UTF-8 encoded.
+
+    Printable ASCII strings are measured with ``len``; the widths of all other
+    strings are cached.
+    """
+    if not _nonascii_search(s):
+        return len(s)
+    w = _widths.get(s)
+    if w is None:
+        text = _ansi_re.sub("", s)
+        if isinstance(text, str):
+            text = text.decode("utf-8", "replace")
+        w = sum(_char_width(c) for c in text)
+        if len(_widths) >= _widths_size:
+            _widths.clear()
+        _widths[s] = w
+    return w
+
+
+def ljust(s, width):
+    """ Pad a string with spaces to the given display width. """
+    return s + " " * (width - display_width(s))
+
+
+def _split_width(s, width):
+    """
+    Split a string into a head of at most ``width`` display columns and the
+    rest. ANSI escape sequences are never split.
+    """
+    i, n, col = 0, len(s), 0
+    while i < n:
+        m = _ansi_re.match(s, i)
+        if m:
+            i = m.end()
+            continue
+        col += _char_width(s[i])
+        if col > width:
+            break
+        i += 1
+    return s[:i], s[i:]
+
+
+def _split_len(s, width):
+    return s[:width], s[width:]
+
+
+_wrap_split = re.compile(r"(\s+)").split
+
+
+class Wrapper(object):
+    """
+    A reusable text wrapper for a fixed width and indentation.
+
+    Text is wrapped the same way as ``textwrap.fill`` with its default options
+    except that lines are only broken on whitespace and not after hyphens.
+    The text is split into words and whitespace with a single regular
+    expression and the lines are filled greedily. Words too long to fit on a
+    line are broken at the line width.
+
+    Text other than printable ASCII is measured by its display width (see
+    ``display_width``), so wide characters and ANSI escape sequences do not
+    upset the line lengths. Byte strings are then taken to be UTF-8 encoded.
+
+    If ``cache_size`` is non-zero, up to that many wrapped results are cached
+    by the wrapped text.
+    """
+    def __init__(self, width, indent="", subindent="", cache_size=0):
+        self.width = width
+        self.indent = indent
+        self.subindent = subindent
+        self.cache_size = cache_size
+        self._cache = {}
+        self._indent_width = display_width(indent)
+        self._subindent_width = display_width(subindent)
+
+    def wrap(self, s):
+        """ Wrap a string into a list of lines. """
+        if self.width <= 0:
+            raise ValueError("invalid width %r (must be > 0)" % self.width)
+        if "\t" in s:
+            s = s.expandtabs()
+        indent, subindent, encoded = self.indent, self.subindent, False
+        if _nontext_search(s):
+            measure, split = display_width, _split_width
+            if isinstance(s, str):
+                try:
+                    s = s.decode("utf-8")
+                except UnicodeDecodeError:
+                    pass
+                else:
+                    encoded = True
+                    if isinstance(indent, str):
+                        indent = indent.decode("utf-8", "replace")
+                    if isinstance(subindent, str):
+                        subindent = subindent.decode("utf-8", "replace")
+        else:
+            measure, split = len, _split_len
+        # Words and runs of whitespace alternate; whitespace becomes spaces.
+        chunks = [c if i % 2 == 0 else " " * len(c)
+                  for i, c in enumerate(_wrap_split(s)) if c]
+        lines = []
+        i, n = 0, len(chunks)
+        while i < n:
+            if lines:
+                prefix, width = subindent, self.width - self._subindent_width
+            else:
+                prefix, width = indent, self.width - self._indent_width
+            # Whitespace is dropped from the start of all but the first line.
+            if lines and not chunks[i].strip():
+                i += 1
+            line, length = [], 0
+            while i < n:
+                l = measure(chunks[i])
+                if length + l > width:
+                    break
+                line.append(chunks[i])
+                length += l
+                i += 1
+            if i < n and measure(chunks[i]) > width:
+                # Break a chunk too long to fit on any line.
+                space = width - length if width >= 1 else 1
+                head, chunks[i] = split(chunks[i], space)
+                if not (head or line):
+                    head, chunks[i] = chunks[i][:1], chunks[i][1:]
+                line.append(head)
+            if line and not line[-1].strip():
+                line.pop()
+            if line:
+                lines.append(prefix + "".join(line))
+        if encoded:
+            lines = [l.encode("utf-8") for l in lines]
+        return lines
+
+    def fill(self, s):
+        """ Wrap a string and return a single string of the wrapped lines. """
+        if self.cache_size:
+            result = self._cache.get(s)
+            if result is None:
+                if len(self._cache) >= self.cache_size:
+                    self._cache.clear()
+                result = self._cache[s] = "\n".join(self.wrap(s))
+            return result
+        return "\n".join(self.wrap(s))
+
+
+_wrappers = {}
+_wrappers_size = 64
+
+
+def wrapper(width, indent="", subindent="", cache=False):
+    """
+    Return the shared ``Wrapper`` instance of a width and indentation.
+
+    If ``cache`` is ``True`` the returned wrapper caches its results.
+    """
+    key = (width, indent, subindent, bool(cache))
+    w = _wrappers.get(key)
+    if w is None:
+        if len(_wrappers) >= _wrappers_size:
+            _wrappers.clear()
+        w = _wrappers[key] = Wrapper(width, indent, subindent,
+                                     cache_size=(cache and 256 or 0))
+    return w
+
+
+def wrap(s, width, indent="", subindent="", cache=False):
     """
     Wraps a string at the specified width and indentation.
 
@@ -63,33 +262,89 @@ def wrap(s, width, indent="", subindent=""):
       - `width`: The width to wrap the string to, in characters
       - `indent`: The indentation string of the first line
       - `subindent`: The indentation of all lines after the first
+      - `cache`: Cache the result for repeated wrapping of the same string
     """
-    return textwrap.fill(s, width=width, initial_indent=indent,
-                         subsequent_indent=subindent)
+    return wrapper(width, indent, subindent, cache).fill(s)
 
 
-def termwidth():
-    """
-    Returns the width of the current console in number of characters.
+_termwidth = None
+_sigwinch_installed = False
+_sigwinch_previous = None
 
-    This function currently only works for *nix systems. It operates by using
-    the *nix standard ``ioctl`` calls to determine the size of the window. If
-    the system is not a *nix system the default value of 80 is returned.
-    """
+
+def _sigwinch(signum, frame):
+    invalidate_termwidth()
+    if callable(_sigwinch_previous):
+        _sigwinch_previous(signum, frame)
+
+
+def _install_sigwinch():
+    """ Invalidate the cached terminal width whenever the window resizes. """
+    global _sigwinch_installed, _sigwinch_previous
+    _sigwinch_installed = True
+    try:
+        import signal
+        _sigwinch_previous = signal.signal(signal.SIGWINCH, _sigwinch)
+    except (ImportError, AttributeError, ValueError):
+        # No SIGWINCH on this platform or not called from the main thread.
+        pass
+
+
+def invalidate_termwidth():
+    """ Discard the cached terminal width; the next ``termwidth`` re-reads it. """
+    global _termwidth
+    _termwidth = None
+
+
+def _query_termwidth():
     try:
         import fcntl, termios
+    except ImportError:
+        pass
+    else:
         for dev in (sys.stdin, sys.stdout, sys.stderr):
             try:
-                fd = dev.fileno()
-            except AttributeError as e:
+                data = fcntl.ioctl(dev.fileno(), termios.TIOCGWINSZ, "\0" * 8)
+            except Exception:
                 continue
-            data = fcntl.ioctl(fd, termios.TIOCGWINSZ, "\0" * 8)
-            return struct.unpack("hhhh", data)[1]
-    except ImportError:
+            width = struct.unpack("hhhh", data)[1]
+            if width > 0:
+                return width
+    try:
+        width = int(os.environ.get("COLUMNS", ""))
+        if width > 0:
+            return width
+    except ValueError:
+        pass
+    try:
+        import shutil
+        return shutil.get_terminal_size((80, 24))[0]
+    except AttributeError:
         pass
     return 80
 
 
+def termwidth():
+    """
+    Returns the width of the current console in number of characters.
+
+    The width is read with the *nix standard ``ioctl`` calls on the first of
+    stdin, stdout or stderr that is a terminal. If none of them is, the
+    ``COLUMNS`` environment variable is used, then the standard library's
+    terminal size query, and finally the default value of 80.
+
+    The width is cached after the first call. Where ``SIGWINCH`` is available
+    the cache is invalidated when the terminal is resized; otherwise call
+    ``invalidate_termwidth`` to force the width to be re-read.
+    """
+    global _termwidth
+    if _termwidth is None:
+        if not _sigwinch_installed:
+            _install_sigwinch()
+        _termwidth = _query_termwidth()
+    return _termwidth
+
+
 _esc = "\033["
 
 _styles = {
@@ -110,6 +365,52 @@ _colors = {
         'white'     : _esc + "37m" }
 
 
+_decorations = {
+        '*'         : _styles['bold'],
+        '/'         : _styles['italic'],
+        '_'         : _styles['underline'],
+        '-'         : _styles['strike'] }
+
+_style_cache = {}
+
+
+def _color(color):
+    """ Return the ANSI foreground color code of a color name or value. """
+    if color in _colors:
+        return _colors[color]
+    if color.isdigit() and int(color) < 256:
+        return "%s38;5;%dm" % (_esc, int(color))
+    if color.startswith("#") and len(color) == 7:
+        try:
+            rgb = tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+        except ValueError:
+            pass
+        else:
+            return "%s38;2;%d;%d;%dm" % ((_esc,) + rgb)
+    raise KeyError(color)
+
+
+def style(color):
+    """
+    Return the ANSI prefix and suffix strings of a color specification.
+
+    The specification is parsed only once; the resulting prefix/suffix pair is
+    cached for all later calls. See ``colorize`` for the format of the color
+    specification. A ``KeyError`` is raised for unknown colors.
+    """
+    try:
+        return _style_cache[color]
+    except KeyError:
+        pass
+    prefix = ""
+    color_ = color
+    if len(color_) > 2 and color_[0] == color_[-1] and color_[0] in _decorations:
+        prefix = _decorations[color_[0]]
+        color_ = color_[1:-1]
+    result = _style_cache[color] = (prefix + _color(color_), _styles['reset'])
+    return result
+
+
 def colorize(s, color):
     """
     Wrap a given message string in ANSI color codes.
@@ -126,6 +427,8 @@ def colorize(s, color):
       - "magenta"
       - "cyan"
       - "white"
+      - "0" to "255": A color of the 256 color palette
+      - "#rrggbb": A 24-bit (truecolor) RGB color in hexadecimal
 
     In addition to the specified color, the text can be made to take on
     additional characteristics: bold, italic, underline, strikethrough. These
@@ -133,30 +436,45 @@ def colorize(s, color):
     ways to change the visual appearance of red text:
 
       - "*red*": Red, Bold
-      - "'red'": Red, Italic
+      - "/red/": Red, Italic
       - "_red_": Red, Underline
       - "-red-": Red, Strikethrough
 
     :Parameters:
       - `s`: The string to colorize.
       - `color`: The color specification string.
-    """        
-    result = []
+    """
     if not color:
         return s
-    if color[0] == color[-1]:
-        if color[0] == "*":
-            result.append(_styles['bold'])
-        elif color[0] == "/":
-            result.append(_styles['italic'])
-        elif color[0] == "_":
-            result.append(_styles['underline'])
-        elif color[0] == "-":
-            result.append(_styles['strike'])
-        if result:
-            color = color[1:-1]
-    result.append(_colors[color])
-    result.append(s)
-    result.append(_styles['reset'])
-    return "".join(result)
+    try:
+        prefix, suffix = _style_cache[color]
+    except KeyError:
+        prefix, suffix = style(color)
+    return prefix + s + suffix
+
+
+def colorize_all(segments):
+    """
+    Colorize and join a list of ``(string, color)`` segments.
 
+    Equivalent to joining the result of ``colorize`` for every segment but
+    builds the output string with a single join.
+
+    :Parameters:
+      - `segments`: Iterable of string and color specification tuples; the
+           color may be ``None`` to leave a segment uncolored.
+    """
+    result = []
+    append = result.append
+    for s, color in segments:
+        if not color:
+            append(s)
+            continue
+        try:
+            prefix, suffix = _style_cache[color]
+        except KeyError:
+            prefix, suffix = style(color)
+        append(prefix)
+        append(s)
+        append(suffix)
+    return "".join(result)
@@ -0,0 +1,7 @@
+@@ source: width=60 @@
+:名前:  The name of the item, long enough to be wrapped onto a second line of output.
+:key:  A plain key.
+@@ expected @@
+名前:  The name of the item, long enough to be wrapped onto
+       a second line of output.
+key:   A plain key.
@@ -0,0 +1,8 @@
+@@ source @@
+Text with *emphasis*, **strong emphasis** and ``inline literal`` markup, but
+not *.py globs, 2*3*4 products or f(*args, **kw) signatures. A ``*literal*``
+is not emphasized and `interpreted`:code: text may use any role :code:`form`.
+@@ expected @@
+Text with emphasis, strong emphasis and "inline literal" markup, but not *.py
+globs, 2*3*4 products or f(*args, **kw) signatures. A "*literal*" is not
+emphasized and "interpreted" text may use any role "form".
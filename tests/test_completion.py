@@ -0,0 +1,84 @@
+# test_completion.py
+
+import os
+import shutil
+import tempfile
+import unittest2 as unittest
+
+from coal import completion, LazyCmd, Opt, Options
+
+
+class SubOptions(Options):
+    opts = [
+        Opt('level', 'l', store={'low':1, 'lower':2, 'high':3}),
+        Opt('name', 'n', store=str) ]
+
+
+class RootOptions(Options):
+    opts = [
+        Opt('verbose', 'v', store=True),
+        Opt('output', 'o', store=str) ]
+    cmds = {
+        'build|b': SubOptions,
+        'bundle': LazyCmd('tests.test_completion:SubOptions') }
+
+
+class CompletionTest(unittest.TestCase):
+    def setUp(self):
+        self.index = completion.build_index(RootOptions)
+
+    def _test(self, line, expected):
+        self.assertEqual(completion.complete(self.index, line.split(' ')), expected)
+
+    def test_index(self):
+        self.assertEqual(sorted(self.index), ['', 'build', 'bundle'])
+        self.assertEqual(self.index['']['commands'],
+                         {'build':'build', 'b':'build', 'bundle':'bundle'})
+        self.assertEqual(self.index['build']['options']['--level'],
+                         {'arg':True, 'values':['high', 'low', 'lower']})
+        self.assertEqual(self.index['build']['options']['-v'],
+                         {'arg':False, 'values':[]})
+
+    def test_complete_commands(self):
+        self._test('', ['b', 'build', 'bundle'])
+        self._test('bu', ['build', 'bundle'])
+        self._test('-o out bui', ['build'])
+
+    def test_complete_options(self):
+        self._test('--', ['--output', '--verbose'])
+        self._test('-', ['--output', '--verbose', '-o', '-v'])
+        self._test('b --', ['--level', '--name', '--output', '--verbose'])
+
+    def test_complete_values(self):
+        self._test('b --level lo', ['low', 'lower'])
+        self._test('b --lev lo', ['low', 'lower'])
+        self._test('b -vl h', ['high'])
+        self._test('b --level=lo', ['--level=low', '--level=lower'])
+        self._test('b --level low ', [])
+        self._test('b --name ', [])
+
+    def test_complete_split_values(self):
+        # bash splits words at '='.
+        self._test('b --level = lo', ['--level=low', '--level=lower'])
+        self._test('b --level =', ['--level=high', '--level=low', '--level=lower'])
+
+    def test_script_quoting(self):
+        script = completion.script('bash', 'prog', '/tmp/a dir/prog.json', 'python')
+        self.assertIn("complete '/tmp/a dir/prog.json' --", script)
+        script = completion.script('fish', 'prog', '/tmp/a dir/prog.json', 'python')
+        self.assertIn("complete \\'/tmp/a dir/prog.json\\' --", script)
+
+    def test_save_load(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            files = completion.write_completion(RootOptions, 'prog', tmpdir,
+                                                python='python')
+            self.assertEqual([os.path.basename(f) for f in files],
+                             ['prog.json', 'prog.bash', 'prog.fish', 'prog.zsh'])
+            self.assertEqual(completion.load_index(files[0]), self.index)
+            with open(files[1]) as f:
+                script = f.read()
+            self.assertIn('complete -o default -F _coal_complete_prog prog', script)
+            self.assertIn('python -m coal.completion complete %s' % files[0], script)
+        finally:
+            shutil.rmtree(tmpdir)
@@ -1,10 +1,19 @@
 # test_config.py
 
 
+import os
+import shutil
 import StringIO
+import time
 import unittest2 as unittest
 
+try:
+    from configparser import Error as ConfigParserError
+except ImportError:
+    from ConfigParser import Error as ConfigParserError
+
 from coal import config, path
+from mock import patch
 
 
 class ConfigStoreTest(unittest.TestCase):
@@ -49,6 +58,30 @@ class ConfigStoreTest(unittest.TestCase):
         self.cfg1.set('section1', 'key1', 'VALUE1')
         self.assertEqual(cfg3.get('section1', 'key1'), 'value1')
 
+    def test_source_interned(self):
+        self.cfg1.set('section1', 'key2', 'value2', 'source1')
+        self.assertIs(self.cfg1.source('section1', 'key1'), self.cfg1.source('section1', 'key2'))
+
+    def test_update_section(self):
+        self.cfg1.update_section('section1', {'key2':'value2', 'key3':'value3'}, '/source2')
+        self.cfg1.update_section('section3', {'key4':'value4'})
+        self.assertEqual(sorted(self.cfg1.items('section1')),
+                         [('key1', 'value1'), ('key2', 'value2'), ('key3', 'value3')])
+        self.assertEqual(self.cfg1.source('section1', 'key1'), path('source1').abspath())
+        self.assertEqual(self.cfg1.source('section1', 'key3'), '/source2')
+        self.assertEqual(self.cfg1.get('section3', 'key4'), 'value4')
+        self.assertEqual(self.cfg1.source('section3', 'key4'), None)
+
+    def test_update_section_copies(self):
+        items = {'key4':'value4'}
+        self.cfg1.update_section('section3', items, '/source3')
+        items['key4'] = 'changed4'
+        self.assertEqual(self.cfg1.get('section3', 'key4'), 'value4')
+
+    def test_source_table_per_store(self):
+        self.cfg1.set('section1', 'key2', 'value2', '/source2')
+        self.assertNotIn('/source2', self.cfg2._sources)
+
     def test_get_sections(self):
         self.cfg1.update(self.cfg2)
         self.assertEqual(sorted(self.cfg1.sections()), ['section1', 'section2'])
@@ -110,6 +143,60 @@ class IniConfigStore(unittest.TestCase):
         self._test('section2', 'key3', 'value3', '/fp')
         self._test('section2', 'key4', 'value4', '/fp')
 
+    def _read(self, text):
+        fp = StringIO.StringIO(text)
+        fp.name = '/fp'
+        self.cfg = config.IniConfigStore()
+        self.cfg.read(fp)
+
+    def test_read_syntax(self):
+        self._read('# comment\n'
+                   '[DEFAULT]\n'
+                   'key0 = default\n'
+                   '[section1]\n'
+                   '  ; indented comment\n'
+                   'Key1 : value1 ; not a comment\n'
+                   'key2 = first\n'
+                   '  second\n'
+                   '\n'
+                   '    third\n'
+                   'key3 =\n'
+                   '[section2]\n'
+                   'key0 = value0\n')
+        self._test('section1', 'key0', 'default', '/fp')
+        self._test('section1', 'key1', 'value1 ; not a comment', '/fp')
+        self._test('section1', 'key2', 'first\nsecond\n\nthird', '/fp')
+        self._test('section1', 'key3', '', '/fp')
+        self._test('section2', 'key0', 'value0', '/fp')
+        self.assertEqual(sorted(self.cfg.sections()), ['section1', 'section2'])
+
+    def test_read_duplicates(self):
+        with self.assertRaises(config.ConfigParseError) as cm:
+            self._read('[section1]\nkey1 = a\nkey2 = b\n'
+                       '[section1]\nkey1 = c\n')
+        self.assertEqual(cm.exception.lineno, 4)
+        with self.assertRaises(config.ConfigParseError) as cm:
+            self._read('[section1]\nkey1 = a\nKEY1 = b\n')
+        self.assertEqual(cm.exception.lineno, 3)
+
+    def test_read_errors(self):
+        with self.assertRaises(config.ConfigParseError) as cm:
+            self._read('key1 = value1\n')
+        self.assertEqual(cm.exception.lineno, 1)
+        with self.assertRaises(config.ConfigParseError) as cm:
+            self._read('[section1]\nkey1 = value1\n\nnot an option\n')
+        self.assertEqual((cm.exception.fname, cm.exception.lineno), ('/fp', 4))
+        self.assertIsInstance(cm.exception, ConfigParserError)
+
+    def test_write_multiline(self):
+        fp = StringIO.StringIO()
+        cfg = config.IniConfigStore()
+        cfg.set('section1', 'key1', 'line1\nline2')
+        cfg.write(fp)
+        self.assertEqual(fp.getvalue(), '[section1]\nkey1 = line1\n\tline2\n\n')
+        self._read(fp.getvalue())
+        self._test('section1', 'key1', 'line1\nline2', '/fp')
+
 
 class ConfigTest(unittest.TestCase):
     ini_file = path(__file__).parent / 'config/ini_test.conf'
@@ -148,3 +235,321 @@ class ConfigTest(unittest.TestCase):
         self.cfg.setconfig('section1', 'key1', 'VALUE1')
         self.assertEqual(cfg.config('section1', 'key1'), 'value1')
 
+    def test_config_int(self):
+        self.cfg.setconfig('section3', 'int', ' 42 ')
+        self.assertEqual(self.cfg.configint('section3', 'int'), 42)
+        self.assertEqual(self.cfg.configint('section3', 'missing', 7), 7)
+        self.cfg.setconfig('section3', 'int', 'many')
+        self.assertRaises(config.ConfigValueError, self.cfg.configint, 'section3', 'int')
+
+    def test_config_bool(self):
+        for value, expected in [('yes', True), ('On', True), ('1', True),
+                                ('false', False), ('NO', False), ('0', False)]:
+            self.cfg.setconfig('section3', 'bool', value)
+            self.assertIs(self.cfg.configbool('section3', 'bool'), expected)
+        self.assertIs(self.cfg.configbool('section3', 'missing', True), True)
+        self.cfg.setconfig('section3', 'bool', 'maybe')
+        self.assertRaises(config.ConfigValueError, self.cfg.configbool, 'section3', 'bool')
+
+    def test_config_list(self):
+        self.cfg.setconfig('section3', 'list', 'a, b  c,\nd,')
+        self.assertEqual(self.cfg.configlist('section3', 'list'), ['a', 'b', 'c', 'd'])
+        self.cfg.configlist('section3', 'list').append('e')
+        self.assertEqual(self.cfg.configlist('section3', 'list'), ['a', 'b', 'c', 'd'])
+        self.assertEqual(self.cfg.configlist('section3', 'missing', []), [])
+
+    def test_config_path_missing(self):
+        self.assertEqual(self.cfg.configpath('section3', 'missing', 'default'), 'default')
+        self.cfg.setconfig('section3', 'nosource', 'value')
+        self.assertEqual(self.cfg.configpath('section3', 'nosource', 'default'), 'default')
+
+    def test_config_cached(self):
+        with patch.object(self.cfg, '_toint', wraps=self.cfg._toint) as toint:
+            self.cfg.setconfig('section3', 'int', '1')
+            self.cfg.setconfig('section3', 'other', '2')
+            self.assertEqual(self.cfg.configint('section3', 'int'), 1)
+            self.assertEqual(self.cfg.configint('section3', 'int'), 1)
+            self.assertEqual(toint.call_count, 1)
+            self.cfg.setconfig('section3', 'other', '3')
+            self.assertEqual(self.cfg.configint('section3', 'int'), 1)
+            self.assertEqual(toint.call_count, 1)
+            self.cfg.setconfig('section3', 'int', '4')
+            self.assertEqual(self.cfg.configint('section3', 'int'), 4)
+            self.cfg.unsetconfig('section3', 'int')
+            self.assertEqual(self.cfg.configint('section3', 'int'), None)
+            other = config.Config()
+            other.setconfig('section3', 'int', '5')
+            self.cfg.updateconfig(other)
+            self.assertEqual(self.cfg.configint('section3', 'int'), 5)
+
+    def test_config_store_changed(self):
+        self.assertEqual(self.cfg.configpath('section1', 'key2'), self.ini_file.abspath() / 'value2')
+        self.cfg._store.set('section1', 'key2', 'changed2', '/source')
+        self.assertEqual(self.cfg.configpath('section1', 'key2'), path('/source/changed2'))
+
+
+class ConfigSnapshotTest(unittest.TestCase):
+    results = path(__file__).parent / 'results'
+
+    def setUp(self):
+        self.results.makedirs_p()
+        self.ini_file = self.results / 'snapshot.conf'
+        self.snapshot = self.results / '.snapshot.conf.snapshot'
+        shutil.copy(path(__file__).parent / 'config/ini_test.conf', self.ini_file)
+        self._touch(-60)
+
+    def tearDown(self):
+        shutil.rmtree(self.results, ignore_errors=True)
+
+    def _touch(self, age):
+        t = time.time() + age
+        os.utime(self.ini_file, (t, t))
+
+    def _load(self):
+        return config.IniConfigStore.load_file(self.ini_file, snapshot=True)
+
+    def test_snapshot_name(self):
+        self.assertEqual(config.snapshot_name('/etc/app.conf'), '/etc/.app.conf.snapshot')
+
+    def test_snapshot(self):
+        cfg = self._load()
+        self.assertTrue(self.snapshot.exists())
+        with patch.object(config.IniConfigStore, 'read') as read:
+            cfg2 = self._load()
+            self.assertFalse(read.called)
+        self.assertEqual(cfg2._data, cfg._data)
+        self.assertEqual(cfg2.source('section2', 'key3'), self.ini_file.abspath())
+
+    def test_snapshot_stale(self):
+        self._load()
+        with open(self.ini_file, 'a') as f:
+            f.write('key5 = value5\n')
+        self._touch(-30)
+        self.assertEqual(self._load().get('section2', 'key5'), 'value5')
+        with patch.object(config.IniConfigStore, 'read') as read:
+            self.assertEqual(self._load().get('section2', 'key5'), 'value5')
+            self.assertFalse(read.called)
+
+    def test_snapshot_recent(self):
+        self._touch(0)
+        self.assertEqual(self._load().get('section1', 'key1'), 'value1')
+        self.assertFalse(self.snapshot.exists())
+
+    def test_snapshot_corrupt(self):
+        with open(self.snapshot, 'wb') as f:
+            f.write('garbage')
+        self.assertEqual(self._load().get('section1', 'key1'), 'value1')
+
+    def test_config_read_only_store(self):
+        class ReadStore(config.ConfigStore):
+            def read(self, fp):
+                self.set('section1', 'read', fp.read().split('\n', 1)[0], fp.name)
+
+        for snapshot in (False, True):
+            cfg = config.Config(ReadStore())
+            cfg.read_file(self.ini_file, snapshot=snapshot)
+            self.assertEqual(cfg.config('section1', 'read'), '[section1]')
+        self.assertFalse(self.snapshot.exists())
+
+    def test_config(self):
+        cfg = config.Config()
+        cfg.read_file(self.ini_file, snapshot=True)
+        self.assertEqual(cfg.configpath('section1', 'key2'), self.ini_file.abspath() / 'value2')
+        self.assertTrue(self.snapshot.exists())
+
+
+class WatchedConfigTest(unittest.TestCase):
+    results = path(__file__).parent / 'results'
+    inotify = False
+
+    def setUp(self):
+        self.results.makedirs_p()
+        self.file1 = (self.results / 'watch1.conf').abspath()
+        self.file2 = (self.results / 'watch2.conf').abspath()
+        self._write(self.file1, '[section1]\nkey1 = value1\nkey2 = value2\n')
+        self._write(self.file2, '[section1]\nkey2 = override2\n')
+        self.cfg = config.WatchedConfig(inotify=self.inotify)
+        self.cfg.read_file(self.file1)
+        self.cfg.read_file(self.file2)
+        self.changes = []
+        self.cfg.add_callback(lambda cfg, changes: self.changes.append(sorted(changes)))
+
+    def tearDown(self):
+        self.cfg.close()
+        shutil.rmtree(self.results, ignore_errors=True)
+
+    def _write(self, fname, text):
+        # Replace the file the way editors do.
+        with open(fname + '.tmp', 'w') as f:
+            f.write(text)
+        os.rename(fname + '.tmp', fname)
+
+    def test_unchanged(self):
+        self.assertEqual(self.cfg.poll(), [])
+        self.assertEqual(self.changes, [])
+
+    def test_change(self):
+        self._write(self.file1, '[section1]\nkey1 = changed1\nkey2 = value2\nkey3 = value3\n')
+        self.assertEqual(sorted(self.cfg.poll(1)), [('section1', 'key1'), ('section1', 'key3')])
+        self.assertEqual(self.changes, [[('section1', 'key1'), ('section1', 'key3')]])
+        self.assertEqual(self.cfg.config('section1', 'key1'), 'changed1')
+        self.assertEqual(self.cfg.source('section1', 'key3'), self.file1)
+
+    def test_override(self):
+        self._write(self.file1, '[section1]\nkey1 = value1\nkey2 = changed2\n')
+        self.assertEqual(self.cfg.poll(1), [])
+        self.assertEqual(self.cfg.config('section1', 'key2'), 'override2')
+        self._write(self.file2, '[section2]\n')
+        self.assertEqual(self.cfg.poll(1), [('section1', 'key2')])
+        self.assertEqual(self.cfg.config('section1', 'key2'), 'changed2')
+        self.assertEqual(self.cfg.source('section1', 'key2'), self.file1)
+
+    def test_remove(self):
+        self._write(self.file1, '[section1]\n')
+        self.assertEqual(sorted(self.cfg.poll(1)), [('section1', 'key1')])
+        self.assertEqual(self.cfg.config('section1', 'key1'), None)
+
+    def test_broken(self):
+        self._write(self.file1, 'key1 = value1\n')
+        self.assertEqual(self.cfg.poll(1), [])
+        self.assertEqual(self.cfg.config('section1', 'key1'), 'value1')
+
+    def test_configpath_cached(self):
+        p = self.cfg.configpath('section1', 'key1')
+        self.assertEqual(p, self.file1 / 'value1')
+        self.assertIs(self.cfg.configpath('section1', 'key1'), p)
+        self.assertEqual(self.cfg.configpath('section1', 'key4', 'default'), 'default')
+        self._write(self.file1, '[section1]\nkey1 = changed1\n')
+        self.cfg.poll(1)
+        self.assertEqual(self.cfg.configpath('section1', 'key1'), self.file1 / 'changed1')
+        self.cfg.setconfig('section1', 'key1', 'set1', '/source')
+        self.assertEqual(self.cfg.configpath('section1', 'key1'), path('/source/set1'))
+
+    def test_chain_store(self):
+        system = config.ConfigStore()
+        system.set('section1', 'key3', 'system3', '/system')
+        cfg = config.WatchedConfig(config.ChainConfigStore(system, config.ConfigStore()), self.inotify)
+        cfg.read_file(self.file1)
+        self.assertEqual(cfg.config('section1', 'key1'), 'value1')
+        self.assertEqual(cfg.config('section1', 'key3'), 'system3')
+        self.assertEqual(system.get('section1', 'key1'), None)
+        self._write(self.file1, '[section1]\nkey1 = changed1\n')
+        self.assertEqual(sorted(cfg.poll(1)), [('section1', 'key1'), ('section1', 'key2')])
+        self.assertEqual(cfg.config('section1', 'key1'), 'changed1')
+        cfg.close()
+
+
+class InotifyWatchedConfigTest(WatchedConfigTest):
+    inotify = True
+
+    def test_watcher(self):
+        if isinstance(self.cfg._watcher, config._InotifyWatcher):
+            self.assertIsNotNone(self.cfg.fileno())
+
+
+class ChainConfigStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.system = config.ConfigStore()
+        self.system.set('section1', 'key1', 'system1', '/system')
+        self.system.set('section1', 'key2', 'system2', '/system')
+
+        self.user = config.ConfigStore()
+        self.user.set('section1', 'key2', 'user2', '/user')
+        self.user.set('section2', 'key3', 'user3', '/user')
+
+        self.cfg = config.ChainConfigStore(self.system, self.user)
+
+    def test_get(self):
+        self.assertEqual(self.cfg.get('section1', 'key1'), 'system1')
+        self.assertEqual(self.cfg.get('section1', 'key2'), 'user2')
+        self.assertEqual(self.cfg.get('section2', 'key3'), 'user3')
+        self.assertEqual(self.cfg.get('section2', 'key4', 'default'), 'default')
+
+    def test_source(self):
+        self.assertEqual(self.cfg.source('section1', 'key1'), '/system')
+        self.assertEqual(self.cfg.source('section1', 'key2'), '/user')
+        self.assertEqual(self.cfg.source('section2', 'key4'), None)
+
+    def test_push_pop(self):
+        cmdline = self.cfg.push()
+        self.cfg.set('section1', 'key1', 'cmdline1')
+        self.assertEqual(self.cfg.get('section1', 'key1'), 'cmdline1')
+        self.assertEqual(cmdline.get('section1', 'key1'), 'cmdline1')
+        self.assertIs(self.cfg.pop(), cmdline)
+        self.assertEqual(self.cfg.get('section1', 'key1'), 'system1')
+        self.assertEqual(self.system.get('section1', 'key1'), 'system1')
+
+    def test_pop_last(self):
+        self.assertRaises(IndexError, config.ChainConfigStore().pop)
+
+    def test_layer_changes(self):
+        self.assertEqual(self.cfg.get('section1', 'key1'), 'system1')
+        self.system.set('section1', 'key1', 'SYSTEM1')
+        self.assertEqual(self.cfg.get('section1', 'key1'), 'SYSTEM1')
+        self.user.set('section1', 'key1', 'user1')
+        self.assertEqual(self.cfg.get('section1', 'key1'), 'user1')
+        self.user.unset('section1', 'key1')
+        self.assertEqual(self.cfg.get('section1', 'key1'), 'SYSTEM1')
+
+    def test_update_section(self):
+        self.cfg.update_section('section1', {'key1':'bulk1'}, '/bulk')
+        self.assertEqual(self.cfg.get('section1', 'key1'), 'bulk1')
+        self.assertEqual(self.user.source('section1', 'key1'), '/bulk')
+        self.assertEqual(self.system.get('section1', 'key1'), 'system1')
+
+    def test_unset_shows_lower_layer(self):
+        self.cfg.unset('section1', 'key2')
+        self.assertEqual(self.cfg.get('section1', 'key2'), 'system2')
+
+    def test_read_write_file(self):
+        cfg = config.ChainConfigStore(self.system, config.IniConfigStore())
+        conf = config.Config(cfg)
+        conf.read_file(path(__file__).parent / 'config/ini_test.conf')
+        self.assertEqual(conf.config('section1', 'key2'), 'value2')
+        self.assertEqual(self.system.get('section1', 'key2'), 'system2')
+        fp = StringIO.StringIO()
+        cfg.write(fp)
+        self.assertIn('key2 = value2', fp.getvalue())
+        self.assertNotIn('system', fp.getvalue())
+
+    def test_version(self):
+        version = self.cfg._version
+        self.system.set('section1', 'key1', 'SYSTEM1')
+        self.assertGreater(self.cfg._version, version)
+        nested = config.ChainConfigStore(self.cfg)
+        version = nested._version
+        self.user.unset('section1', 'key2')
+        self.assertGreater(nested._version, version)
+        layer = self.cfg.push()
+        self.cfg.pop()
+        version = self.cfg._version
+        layer.set('section1', 'key1', 'popped1')
+        self.assertEqual(self.cfg._version, version)
+
+    def test_sections_items(self):
+        self.assertEqual(sorted(self.cfg.sections()), ['section1', 'section2'])
+        self.assertTrue('section2' in self.cfg)
+        self.assertEqual(sorted(self.cfg.items('section1')),
+                         [('key1', 'system1'), ('key2', 'user2')])
+
+    def test_copy(self):
+        cfg = self.cfg.copy()
+        self.cfg.set('section1', 'key2', 'USER2')
+        self.assertEqual(cfg.get('section1', 'key2'), 'user2')
+        self.assertIs(cfg.layers[0], self.system)
+
+    def test_flatten(self):
+        cfg = config.ConfigStore(self.cfg)
+        self.assertEqual(cfg.get('section1', 'key2'), 'user2')
+        self.assertEqual(cfg.source('section1', 'key1'), '/system')
+
+    def test_nested(self):
+        cfg = config.ChainConfigStore(self.cfg)
+        self.assertEqual(cfg.get('section1', 'key2'), 'user2')
+        self.cfg.push().set('section1', 'key2', 'nested2')
+        self.assertEqual(cfg.get('section1', 'key2'), 'nested2')
+
+    def test_config(self):
+        cfg = config.Config(self.cfg)
+        self.assertEqual(cfg.config('section1', 'key2'), 'user2')
+        self.assertEqual(cfg.source('section1', 'key1'), '/system')
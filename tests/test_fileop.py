@@ -117,6 +117,40 @@ class FileOpStatusTest(FileOpStatusHelper):
         self.assert_status('status', '/path/to/file', color=id(self))
 
 
+class FileOpSummarizeTest(FileOpBaseHelper):
+    def copy_twice(self):
+        with self.fop.summarize():
+            self.fop.copy_file('source1.txt')
+            self.fop.copy_file('source2.txt')
+            self.fop.copy_file('source1.txt')
+            self.fop.copy_file('source2.txt')
+
+    def test_summarize_hides_identical(self):
+        self.copy_twice()
+        lines = self.stdout.splitlines()
+        self.assertEqual(lines[:2], [
+            '      create  %s' % self.dst('source1.txt').relpath(),
+            '      create  %s' % self.dst('source2.txt').relpath()])
+        self.assertRegexpMatches(lines[2], r'^4 files: create 2, identical 2 \(')
+        self.assertEqual(len(lines), 3)
+
+    def test_summarize_verbose(self):
+        self.shell.verbose = True
+        self.copy_twice()
+        lines = self.stdout.splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[2], '   identical  %s' % self.dst('source1.txt').relpath())
+
+    def test_summarize_progress(self):
+        self.shell.isatty = mock.Mock(return_value=True)
+        with self.fop.summarize(interval=0):
+            self.fop.copy_file('source1.txt')
+            self.fop.copy_file('source1.txt')
+        out = self.stdout
+        self.assertIn('\r1 files: create 1 (', out)
+        self.assertIn('\r2 files: create 1, identical 1 (', out)
+
+
 class FileOpInsideTest(FileOpStatusHelper):
     def test_inside_relative_dir(self):
         with self.fop.inside('path/to/dir'):
@@ -0,0 +1,40 @@
+# test_import.py
+
+
+import os
+import subprocess
+import sys
+import unittest2 as unittest
+
+
+def modules_after(code):
+    """ Run ``code`` in a new interpreter and return the imported modules. """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    out = subprocess.check_output([sys.executable, "-c",
+        "import sys\n%s\nprint '\\n'.join(k for k, v in sys.modules.items() if v)" % code],
+        cwd=root)
+    return set(out.split())
+
+
+class ImportTest(unittest.TestCase):
+    def test_import_coal_is_lazy(self):
+        modules = modules_after("import coal")
+        self.assertNotIn("coal.fileop", modules)
+        self.assertNotIn("coal.options", modules)
+        self.assertNotIn("mako", modules)
+
+    def test_options_does_not_import_mako(self):
+        modules = modules_after("from coal import Options")
+        self.assertIn("coal.options", modules)
+        self.assertNotIn("mako", modules)
+
+    def test_fileop_does_not_import_mako(self):
+        modules = modules_after("from coal import FileOp")
+        self.assertIn("coal.fileop", modules)
+        self.assertNotIn("mako", modules)
+
+    def test_import_star(self):
+        modules = modules_after("from coal import *\n"
+                                "assert set(['FileOp', 'Options', 'Opt', 'Shell', 'ColorShell',\n"
+                                "            'config', 'path']) <= set(globals())")
+        self.assertIn("coal.fileop", modules)
@@ -3,10 +3,13 @@
 
 import glob
 import os
+import StringIO
 import unittest2 as unittest
 
 from coal import minirst
 
+from mock import patch
+
 
 def re_test(re_, pass_):
     def decorator(fn_):
@@ -94,6 +97,37 @@ class MiniRSTTest(unittest.TestCase):
         test(".. tip::", "tip", 8)
         test(".. warning::  ", "warning", 14)
 
+
+class MiniRSTFormatManyTest(unittest.TestCase):
+    docs = ["Paragraph %d." % (i % 7) for i in xrange(40)] + \
+           [".. container:: verbose\n\n  Verbose text.", "- item one\n- item two"]
+
+    def expected(self, **kw):
+        return [minirst.format_rst(d, **kw) for d in self.docs]
+
+    def test_format_many(self):
+        self.assertEqual(minirst.format_many(self.docs), self.expected())
+        self.assertEqual(minirst.format_many(self.docs, width=40, keep=[], indent="  "),
+                         self.expected(width=40, keep=[], indent="  "))
+
+    def test_format_many_empty(self):
+        self.assertEqual(minirst.format_many([]), [])
+
+    def test_format_many_cache_untouched(self):
+        minirst._cache.clear()
+        minirst.format_many(self.docs)
+        self.assertEqual(len(minirst._cache), 0)
+
+    def test_format_many_processes(self):
+        self.assertEqual(minirst.format_many(iter(self.docs), keep=["verbose"], processes=2),
+                         self.expected(keep=["verbose"]))
+
+    def test_format_many_preprocess_once(self):
+        with patch.object(minirst, "_preprocess", wraps=minirst._preprocess) as preprocess:
+            minirst.format_many(self.docs, processes=2)
+            self.assertEqual(preprocess.call_count, len(set(self.docs)))
+
+
 def build_test(p):
     def test(self):
         self.rst_test(p)
@@ -103,3 +137,118 @@ for fname in glob.glob(os.path.join(os.path.dirname(__file__), "rst", "*.t")):
     test_name = "test_%s" % os.path.basename(fname)[:-1].replace("-", "_")
     setattr(MiniRSTTest, test_name, build_test(fname)) 
 
+
+class MiniRSTParseTest(unittest.TestCase):
+    def lines(self, src):
+        return minirst._preprocess(src)
+
+    def test_simple_block(self):
+        src = self.lines("a\nb\n\nc")
+        self.assertEqual(minirst.simple_block(src, 0), ([[0, "a"], [0, "b"]], 2))
+        self.assertEqual(minirst.simple_block(src, 3), ([[0, "c"]], 4))
+
+    def test_nested_block(self):
+        src = self.lines("a\n\n    b\n\n      c\n\nd")
+        block, i = minirst.nested_block(src, 1)
+        self.assertEqual(block, [[0, "b"], [-4, ""], [2, "c"]])
+        self.assertEqual(i, 6)
+        self.assertEqual(src[2], [4, "b"])
+
+    def test_nested_block_shift_first(self):
+        src = self.lines("- a\n  b\nc")
+        self.assertEqual(minirst.nested_block(src, 0, shift_first=2),
+                         ([[0, "a"], [0, "b"]], 2))
+
+    def test_transition_dispatch(self):
+        def parse_rule(src, i):
+            if src[i][1] != "====":
+                return False, None, i
+            return True, lambda width, indent, **kw: [indent + "-" * 4], i + 1
+        transitions = [minirst.parse_blank, parse_rule] + minirst._transitions[1:]
+        with patch.object(minirst, "_transitions", transitions):
+            self.assertEqual(list(minirst.parse_body(self.lines("a\n\n===="))(80, "")),
+                             ["a", "", "----"])
+        self.assertEqual(list(minirst.parse_body(self.lines("a\n\n===="))(80, "")),
+                         ["a", "", "===="])
+
+
+class MiniRSTInlineTest(unittest.TestCase):
+    def setUp(self):
+        self.handlers = list(minirst.inline_handlers)
+
+    def tearDown(self):
+        minirst.inline_handlers[:] = self.handlers
+
+    def test_register_role(self):
+        minirst.register_role("upper", lambda s: s.upper())
+        self.assertEqual(minirst._parse_interpreted(":upper:`text` `more`:upper:"),
+                         "TEXT MORE")
+
+    def test_register_role_replace(self):
+        minirst.register_role("strong", lambda s: "[%s]" % s)
+        self.assertEqual(minirst._parse_interpreted("**a** and :strong:`b`"),
+                         "[a] and [b]")
+        self.assertEqual(len(minirst.inline_handlers), len(self.handlers))
+
+    def test_unknown_role(self):
+        self.assertEqual(minirst._parse_interpreted(":unknown:`text`"),
+                         ":unknown:`text`")
+
+    def test_inline_regex_cached(self):
+        inline_re = minirst._inline_table()[0]
+        self.assertIs(minirst._inline_table()[0], inline_re)
+        minirst.register_role("upper", lambda s: s.upper())
+        self.assertIsNot(minirst._inline_table()[0], inline_re)
+
+
+class MiniRSTDocumentTest(unittest.TestCase):
+    source = "Paragraph text that is long enough to be wrapped.\n\n" \
+             ".. container:: verbose\n\n  Verbose text.\n"
+
+    def setUp(self):
+        minirst._cache.clear()
+
+    def tearDown(self):
+        minirst._cache.clear()
+
+    def test_render(self):
+        doc = minirst.parse(self.source)
+        self.assertEqual(doc.render(30),
+                         "Paragraph text that is long\nenough to be wrapped.\n\n"
+                         "Verbose text.")
+        self.assertEqual(doc.render(80, "  ", keep=[]),
+                         "  Paragraph text that is long enough to be wrapped.")
+        self.assertEqual(doc.render(80, keep=["verbose"]),
+                         minirst.format_rst(self.source, keep=["verbose"]))
+
+    def test_lines(self):
+        lines = minirst.parse(self.source).lines(30, keep=[])
+        self.assertEqual(next(lines), "Paragraph text that is long")
+        self.assertEqual(list(lines), ["enough to be wrapped."])
+
+    def test_write(self):
+        out = StringIO.StringIO()
+        minirst.parse(self.source).write(out, 80, "  ")
+        self.assertEqual(out.getvalue(),
+                         "  Paragraph text that is long enough to be wrapped.\n\n"
+                         "  Verbose text.\n")
+
+    def test_parse_cached(self):
+        doc = minirst.parse(self.source)
+        self.assertIs(minirst.parse(self.source), doc)
+        self.assertIsNot(minirst.parse(self.source + "\nMore."), doc)
+
+    def test_parse_cache_lru(self):
+        with patch.object(minirst, "cache_size", 2):
+            doc1 = minirst.parse("one")
+            doc2 = minirst.parse("two")
+            minirst.parse("one")
+            minirst.parse("three")
+            self.assertIs(minirst.parse("one"), doc1)
+            self.assertIsNot(minirst.parse("two"), doc2)
+            self.assertEqual(len(minirst._cache), 2)
+
+    def test_parse_cache_disabled(self):
+        with patch.object(minirst, "cache_size", 0):
+            self.assertIsNot(minirst.parse("one"), minirst.parse("one"))
+            self.assertEqual(len(minirst._cache), 0)
@@ -4,9 +4,13 @@
 import coal
 import mock
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest2 as unittest
 
-from coal import error, Opt, Options
+from coal import error, options, LazyCmd, Opt, Options
 
 from mock import patch
 
@@ -95,6 +99,41 @@ class OptionsOptTest(unittest.TestCase):
     def test_opt_parse_invalid_option_arg_enumeration(self):
         self.assertRaises(error.OptionsError, self.parse, '--delta=123')
 
+    def test_opt_parse_long_prefix(self):
+        self._test('--al --ch ARG --fox ARG1', [], {'alpha':True,
+            'charlie':self.opt_c.return_value, 'fox-trot':['ARG1']})
+
+    def test_opt_parse_long_option_attached(self):
+        self._test('--echo=12', [], {'echo':12})
+
+    def test_opt_parse_short_grouped_option(self):
+        self._test('-abe12', [], {'alpha':True, 'bravo':True, 'echo':12})
+
+    def test_opt_parse_args_interleaved(self):
+        self._test('arg1 -a arg2 -- -b', ['arg1', 'arg2', '-b'], {'alpha':True})
+
+    def _test_error(self, cmd, msg):
+        with self.assertRaises(error.OptionsError) as cm:
+            self.parse(cmd)
+        self.assertEqual(str(cm.exception), msg)
+
+    def test_opt_parse_errors(self):
+        self._test_error('--zulu', 'option --zulu not recognized')
+        self._test_error('-z', 'option -z not recognized')
+        self._test_error('--echo', 'option --echo requires argument')
+        self._test_error('-ae', 'option -e requires argument')
+        self._test_error('--alpha=1', 'option --alpha must not have an argument')
+        self._test_error('-eARG', 'invalid argument to option -e: ARG')
+
+    def test_opt_parse_error_no_handlers_run(self):
+        self._test_error('-c 1 -f x --zulu', 'option --zulu not recognized')
+        self.assertFalse(self.opt_c.called)
+        self.assertEqual(self.cmd['fox-trot'], None)
+
+    def test_opt_parse_error_precedence(self):
+        self._test_error('-eARG --zulu', 'option --zulu not recognized')
+        self._test_error('-eARG -c 1 -eBAD', 'invalid argument to option -e: ARG')
+
 
 class OptionsSubCmdTest(unittest.TestCase):
     def setUp(self):
@@ -226,6 +265,138 @@ class OptionsSubCmdTest(unittest.TestCase):
     def test_cmd_parse_unknown_command(self):
         self.assertRaises(error.OptionsError, self.parse, 'cmd3')
 
+    def test_cmd_parse_prefix(self):
+        self._test('cmd1 cmd', [], {}, ('sub_command1', {}), ('sub_sub_command1', {}))
+        self.assertEqual(self.app.subcmd.subcmd._cmdname, 'cmd1-1')
+
+    def test_cmd_parse_ambiguous_prefix(self):
+        with self.assertRaises(error.OptionsError) as cm:
+            self.parse('comm')
+        self.assertEqual(str(cm.exception), 'command comm is ambiguous: command1 command2')
+
+    def test_cmd_parse_unknown_command_suggestions(self):
+        with self.assertRaises(error.OptionsError) as cm:
+            self.parse('cmd3')
+        self.assertEqual(str(cm.exception), 'unknown command: cmd3 (did you mean cmd1 or cmd2?)')
+
+    def test_cmd_parse_unknown_command_no_suggestions(self):
+        with self.assertRaises(error.OptionsError) as cm:
+            self.parse('xyzzy')
+        self.assertEqual(str(cm.exception), 'unknown command: xyzzy')
+
+    def test_cmd_index_empty_name(self):
+        index = options._CmdIndex({'only': Options})
+        self.assertEqual(index.find(''), None)
+        self.assertEqual(index.find('o'), 'only')
+
+    def test_cmd_index_short_suggestions(self):
+        index = options._CmdIndex({'m': Options, 'make': Options})
+        self.assertEqual(index.suggest('4'), [])
+        self.assertEqual(index.suggest('mn'), [])
+        self.assertEqual(index.suggest('mak'), ['make'])
+
+    def test_cmd_parse_repeated(self):
+        self._test('-c cmd1 -e a cmd1-1 arg1 -d 1.0 -a -e Hello', ['arg1'], {'charlie':1},
+                ('sub_command1', {'delta':1.0, 'echo':4}),
+                ('sub_sub_command1', {'echo':'Hello'}))
+        self.sub_sub_command1.reset_mock()
+        self.post_actions = []
+        self.app = self.app.__class__()
+        self._test('cmd1 cmd1-1 arg2 -e Bye', ['arg2'], {'charlie':None},
+                ('sub_command1', {'delta':None, 'echo':None}),
+                ('sub_sub_command1', {'echo':'Bye'}))
+
+
+class OptionsTableTest(unittest.TestCase):
+    def setUp(self):
+        class TestOptions(Options):
+            opts = [
+                Opt('alpha', 'a', store=True),
+                Opt('bravo', 'b', handler='bravo') ]
+            def bravo(self_):
+                self_['bravo'] = 'flag'
+
+        self.cls = TestOptions
+
+    def test_table_shared(self):
+        cmd1, cmd2 = self.cls(), self.cls()
+        self.assertIs(cmd1._handlers, cmd2._handlers)
+        self.assertIs(cmd1._merged_opttable([cmd1]), cmd2._merged_opttable([cmd2]))
+
+    def test_options_not_shared(self):
+        cmd1, cmd2 = self.cls(), self.cls()
+        cmd1.parse(['-a'])
+        self.assertEqual(cmd1['alpha'], True)
+        self.assertEqual(cmd2['alpha'], None)
+
+    def test_handler_without_argument_is_flag(self):
+        cmd = self.cls()
+        cmd.parse(['-b'])
+        self.assertEqual(cmd['bravo'], 'flag')
+
+
+class LazySubOptions(Options):
+    desc = """lazily loaded sub-command"""
+    opts = [
+        Opt('alpha', 'a', store=True) ]
+
+
+class OptionsLazyCmdTest(unittest.TestCase):
+    def setUp(self):
+        class TestOptions(Options):
+            cmds = {
+                'lazy':'tests.test_options:LazySubOptions',
+                'loader':LazyCmd(lambda: LazySubOptions),
+                'missing':LazyCmd('tests.no_such_module:Missing', 'not loaded') }
+
+        self.cmd = TestOptions()
+
+    def test_lazy_string(self):
+        self.cmd.parse(['lazy', '-a'])
+        self.assertIsInstance(self.cmd.subcmd, LazySubOptions)
+        self.assertEqual(self.cmd.subcmd['alpha'], True)
+
+    def test_lazy_loader(self):
+        self.cmd.parse(['loader'])
+        self.assertIsInstance(self.cmd.subcmd, LazySubOptions)
+
+    def test_lazy_short_desc(self):
+        entries = self.cmd._cmdindex().entries
+        self.assertEqual(entries['lazy'].short_desc(), 'lazily loaded sub-command')
+        self.assertEqual(entries['missing'].short_desc(), 'not loaded')
+
+    def test_lazy_missing(self):
+        self.assertRaises(error.OptionsError, self.cmd.parse, ['missing'])
+        cmd = LazyCmd('tests.test_options:NoSuchClass')
+        self.assertRaises(error.OptionsError, cmd.load)
+
+
+class OptionsLazyCmdDescTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, 'lazy_desc_cmds.py'), 'w') as f:
+            f.write('from coal import Options\n'
+                    'class LiteralOptions(Options):\n'
+                    '    desc = """literal description\n\n    long"""\n'
+                    'class InheritedOptions(LiteralOptions):\n'
+                    '    pass\n')
+        sys.path.insert(0, self.tmpdir)
+
+    def tearDown(self):
+        sys.path.remove(self.tmpdir)
+        sys.modules.pop('lazy_desc_cmds', None)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_desc_without_import(self):
+        cmd = LazyCmd('lazy_desc_cmds:LiteralOptions')
+        self.assertEqual(cmd.short_desc(), 'literal description')
+        self.assertNotIn('lazy_desc_cmds', sys.modules)
+
+    def test_desc_inherited(self):
+        cmd = LazyCmd('lazy_desc_cmds:InheritedOptions')
+        self.assertEqual(cmd.short_desc(), 'literal description')
+        self.assertIn('lazy_desc_cmds', sys.modules)
+
 
 class OptionsInheritanceTest(unittest.TestCase):
     def setUp(self):
@@ -313,3 +484,116 @@ class OptionsHelpTest(ShellBaseTest):
     def test_help_sub_command_normal(self):
         self._test(self.cmd.findcmd('subcmd'), 'subcmd_normal.t')
 
+
+
+class OptionsHelpCacheTest(OptionsHelpTest):
+    def setUp(self):
+        OptionsHelpTest.setUp(self)
+        self.cachedir = tempfile.mkdtemp()
+        self.cmd.help_cache_dir = self.cachedir
+        self.shell.width = 80
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir, ignore_errors=True)
+        OptionsHelpTest.tearDown(self)
+
+    def test_help_cached_in_memory(self):
+        self._test(self.cmd, 'cmd_normal.t')
+        with patch.object(self.cmd, '_render_help') as render:
+            self._test(self.cmd, 'cmd_normal.t')
+            self.assertFalse(render.called)
+
+    def test_help_cache_keyed_by_width(self):
+        self._test(self.cmd, 'cmd_normal.t')
+        self.shell.width = 40
+        with patch.object(self.cmd, '_render_help') as render:
+            render.return_value = ['narrow\n']
+            self.cmd.help()
+            self.assertEqual(self.stdout, 'narrow\n')
+
+    def test_help_cached_on_disk(self):
+        self._test(self.cmd, 'cmd_normal.t')
+        options._help_cache.clear()
+        with patch.object(self.cmd, '_render_help') as render:
+            self._test(self.cmd, 'cmd_normal.t')
+            self.assertFalse(render.called)
+
+    def test_help_disk_cache_invalidated(self):
+        self._test(self.cmd, 'cmd_normal.t')
+        options._help_cache.clear()
+        with patch.object(options, '_source_mtime') as mtime:
+            mtime.return_value = (__file__, 0)
+            with patch.object(self.cmd, '_render_help') as render:
+                render.return_value = ['changed\n']
+                self.cmd.help()
+                self.assertEqual(self.stdout, 'changed\n')
+
+    def test_help_disk_cache_invalidated_by_renderer(self):
+        self._test(self.cmd, 'cmd_normal.t')
+        options._help_cache.clear()
+        file_mtime = options._file_mtime
+        def _file_mtime(fname):
+            if os.path.basename(fname) == 'minirst.py':
+                return fname, 0
+            return file_mtime(fname)
+        with patch.object(options, '_file_mtime', _file_mtime):
+            with patch.object(self.cmd, '_render_help') as render:
+                render.return_value = ['changed\n']
+                self.cmd.help()
+                self.assertEqual(self.stdout, 'changed\n')
+
+
+
+class OptionsHelpLazyDiskCacheTest(unittest.TestCase):
+    script = """
+import sys
+sys.path.insert(0, %(tmpdir)r)
+from coal import Options
+import lazy_help_app
+renders = []
+render = Options._render_help
+def _render_help(self):
+    renders.append(1)
+    return render(self)
+Options._render_help = _render_help
+lazy_help_app.AppOptions().help()
+sys.stderr.write('render' if renders else 'disk')
+"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, 'lazy_help_app.py'), 'w') as f:
+            f.write('from coal import Options\n'
+                    'class AppOptions(Options):\n'
+                    '    usage = "[options] command"\n'
+                    '    help_cache_dir = %r\n'
+                    '    cmds = {\n'
+                    '        "one":"lazy_help_cmds:OneOptions",\n'
+                    '        "two":"lazy_help_cmds:TwoOptions" }\n'
+                    % os.path.join(self.tmpdir, 'cache'))
+        with open(os.path.join(self.tmpdir, 'lazy_help_cmds.py'), 'w') as f:
+            f.write('from coal import Options\n'
+                    'class OneOptions(Options):\n'
+                    '    desc = "the first command"\n'
+                    'class TwoOptions(OneOptions):\n'
+                    '    pass\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _help(self):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        proc = subprocess.Popen(
+            [sys.executable, '-c', self.script % {'tmpdir': self.tmpdir}],
+            cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = proc.communicate()
+        self.assertEqual(proc.returncode, 0, err)
+        return out, err
+
+    def test_help_read_from_disk(self):
+        out, err = self._help()
+        self.assertEqual(err, 'render')
+        self.assertIn('the first command', out)
+        out_, err = self._help()
+        self.assertEqual(err, 'disk')
+        self.assertEqual(out_, out)
@@ -1,10 +1,12 @@
 # test_shell.py
 
 
+import difflib
 import StringIO
+import time
 import unittest2 as unittest
 
-from coal import minirst, util
+from coal import minirst, shell, util
 from coal.shell import Shell, ColorShell
 
 from mock import Mock, patch
@@ -199,6 +201,123 @@ class ShellTest(ShellBaseTest):
         self._test_output_kw_options("warn", "write_err")
 
 
+class ShellDiffTest(ShellBaseTest):
+    def test_diff_matches_difflib(self):
+        left = ["line %d\n" % i for i in range(200)]
+        right = list(left)
+        right[10] = "changed\n"
+        del right[50:55]
+        right.insert(120, "inserted\n")
+
+        self.assertEqual(list(shell.unified_diff(left, right, "l", "r")),
+                         list(difflib.unified_diff(left, right, "l", "r")))
+
+    def test_diff_max_edit_distance(self):
+        left = "".join("left %d\n" % i for i in range(100))
+        right = "".join("right %d\n" % i for i in range(100))
+
+        self.shell.diff_maxd = 10
+        self.shell.diff(left, right, "left", "right")
+
+        lines = self.stdout.splitlines()
+        self.assertEqual(lines[:3], ["--- left", "+++ right", "@@ -1,100 +1,100 @@"])
+        self.assertEqual(len(lines), 203)
+
+    def test_diff_limit(self):
+        left = "".join("line %d\n" % i for i in range(10))
+        right = "".join("LINE %d\n" % i for i in range(10))
+
+        self.shell.diff_limit = 5
+        self.shell.diff(left, right, "left", "right")
+
+        lines = self.stdout.splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[-1], "... 18 more lines not shown (10 added, 8 removed)")
+
+
+class ShellBufferTest(ShellBaseTest):
+    def test_buffered_flush_on_exit(self):
+        with self.shell.buffered():
+            self.shell.write("Hello ")
+            self.shell.write("World!")
+            self.assertEqual(self.stdout, "")
+        self.assertEqual(self.stdout, "Hello World!")
+
+    def test_buffered_flush_on_size(self):
+        with self.shell.buffered(size=10):
+            self.shell.write("12345")
+            self.assertEqual(self.stdout, "")
+            self.shell.write("67890")
+            self.assertEqual(self.stdout, "1234567890")
+
+    def test_buffered_flush_on_lines(self):
+        with self.shell.buffered(size=None, lines=2):
+            self.shell.write("one\n")
+            self.assertEqual(self.stdout, "")
+            self.shell.write("two\n")
+            self.assertEqual(self.stdout, "one\ntwo\n")
+
+    @patch.object(time, "time")
+    def test_buffered_flush_on_interval(self, time_):
+        time_.return_value = 100.0
+        with self.shell.buffered(size=None, interval=1.0):
+            self.shell.write("one\n")
+            self.assertEqual(self.stdout, "")
+            time_.return_value = 101.0
+            self.shell.write("two\n")
+            self.assertEqual(self.stdout, "one\ntwo\n")
+
+    @patch.object(time, "time")
+    def test_buffered_interval_starts_on_enter(self, time_):
+        time_.return_value = 100.0
+        self.shell.flush()
+        time_.return_value = 200.0
+        with self.shell.buffered(size=None, interval=1.0):
+            self.shell.write("one\n")
+            self.assertEqual(self.stdout, "")
+
+    def test_buffered_flush_on_prompt(self):
+        self.stdin = "a\n"
+        with self.shell.buffered():
+            self.shell.write("Pick one\n")
+            self.shell.choose("Which one? ", ["a", "b"])
+            self.assertEqual(self.stdout, "Pick one\nWhich one? ")
+
+    def test_buffered_flush_on_write_err(self):
+        with self.shell.buffered():
+            self.shell.write("Hello")
+            self.shell.write_err("ERROR!")
+            self.assertEqual(self.stdout, "Hello")
+            self.assertEqual(self.stderr, "ERROR!")
+
+    def test_buffered_restores_unbuffered(self):
+        with self.shell.buffered():
+            pass
+        self.assertFalse(self.shell.buffering)
+        self.shell.write("Hello")
+        self.assertEqual(self.stdout, "Hello")
+
+
+class ShellProgressTest(ShellBaseTest):
+    def test_progress_not_a_tty(self):
+        self.shell.progress("1 files")
+        self.assertEqual(self.stdout, "")
+
+    def test_progress_cleared_by_write(self):
+        self.shell.isatty = Mock(return_value=True)
+        self.shell.progress("10 files")
+        self.shell.progress("2 files")
+        self.shell.write("done\n")
+        self.assertEqual(self.stdout,
+                         "\r10 files\r2 files \r       \rdone\n")
+
+    def test_progress_quiet(self):
+        self.shell.isatty = Mock(return_value=True)
+        self.shell.quiet = True
+        self.shell.progress("1 files")
+        self.assertEqual(self.stdout, "")
+
+
 class ShellTermWidthTest(ShellBaseTest):
     @patch.object(util, "termwidth")
     def test_termwidth(self, termwidth):
@@ -243,6 +362,20 @@ class ShellRSTFormatTest(ShellBaseTest):
 
         format.assert_called_once_with("RST source text", indent="", width=80, keep=[keep[0], "verbose"])
 
+    def test_write_rst(self):
+        self.shell.verbose = True
+        self.shell.write_rst("Paragraph text.\n\n.. container:: verbose\n\n  Verbose text.\n\n"
+                             ".. container:: debug\n\n  Debug.", width=80, indent="  ")
+        self.assertEqual(self.stdout, "  Paragraph text.\n\n  Verbose text.\n")
+
+    def test_write_rst_buffered(self):
+        with patch.object(self.shell, "termwidth") as width:
+            width.return_value = 12
+            with self.shell.buffered():
+                self.shell.write_rst("Paragraph text to wrap.")
+                self.assertEqual(self.stdout, "")
+        self.assertEqual(self.stdout, "Paragraph\ntext to\nwrap.\n")
+
 
 class ColorShellTest(ShellTest):
     def build_shell(self, stdin, stdout, stderr):
@@ -3,11 +3,16 @@
 import os
 import coal
 import shutil
+import signal
+import StringIO
+import sys
 import unittest2 as unittest
 
 from coal import error, util
 from coal.util import checksignature
 
+from mock import patch
+
 
 def path(p):
     return os.path.abspath(os.path.join(os.path.dirname(__file__), p))
@@ -61,6 +66,100 @@ class UtilWrapTest(unittest.TestCase):
     def test_wrap_width_indent_hanging(self):
         self.assertEqual(util.wrap("this is a string", 8, "  ", "  "), "  this\n  is a\n  string")
 
+    def test_wrap_whitespace(self):
+        self.assertEqual(util.wrap("  this\tis  a\nstring  ", 10), "  this  is\na string")
+
+    def test_wrap_long_word(self):
+        self.assertEqual(util.wrap("a abcdefghij", 6, "", "  "), "a abcd\n  efgh\n  ij")
+
+    def test_wrap_hyphens(self):
+        self.assertEqual(util.wrap("ab long-word", 10), "ab\nlong-word")
+
+    def test_wrap_invalid_width(self):
+        self.assertRaises(ValueError, util.wrap, "string", 0)
+
+    def test_wrapper_shared(self):
+        self.assertIs(util.wrapper(10, "  "), util.wrapper(10, "  "))
+        self.assertIsNot(util.wrapper(10, "  "), util.wrapper(10, "  ", "  "))
+        self.assertIsNot(util.wrapper(10), util.wrapper(10, cache=True))
+
+    def test_wrapper_cache(self):
+        wrapper = util.Wrapper(6, cache_size=2)
+        with patch.object(wrapper, "wrap", wraps=wrapper.wrap) as wrap:
+            self.assertEqual(wrapper.fill("this is a string"), "this\nis a\nstring")
+            self.assertEqual(wrapper.fill("this is a string"), "this\nis a\nstring")
+            self.assertEqual(wrap.call_count, 1)
+            wrapper.fill("one")
+            wrapper.fill("two")
+            self.assertEqual(len(wrapper._cache), 1)
+
+    def test_wrap_wide(self):
+        self.assertEqual(util.wrap(u"\u6f22\u5b57 \u6f22\u5b57 ab", 7), u"\u6f22\u5b57\n\u6f22\u5b57 ab")
+        self.assertEqual(util.wrap(u"\u6f22\u5b57\u6f22\u5b57", 3), u"\u6f22\n\u5b57\n\u6f22\n\u5b57")
+
+    def test_wrap_utf8(self):
+        self.assertEqual(util.wrap("caf\xc3\xa9 caf\xc3\xa9", 9, "  "), "  caf\xc3\xa9\ncaf\xc3\xa9")
+
+    def test_wrap_colorized(self):
+        s = " ".join([util.colorize("red", "red"), util.colorize("green", "green")])
+        self.assertEqual(util.wrap(s, 9), s)
+        self.assertEqual(util.wrap(s, 8).split("\n"),
+                         [util.colorize("red", "red"), util.colorize("green", "green")])
+
+
+class UtilDisplayWidthTest(unittest.TestCase):
+    def test_ascii(self):
+        self.assertEqual(util.display_width("hello"), 5)
+        self.assertEqual(util.display_width(u"hello"), 5)
+
+    def test_wide(self):
+        self.assertEqual(util.display_width(u"\u6f22\u5b57"), 4)
+        self.assertEqual(util.display_width("\xe6\xbc\xa2\xe5\xad\x97"), 4)
+        self.assertEqual(util.display_width(u"\uff21"), 2)
+        self.assertEqual(util.display_width(u"\U0001f600"), 2)
+
+    def test_zero_width(self):
+        self.assertEqual(util.display_width(u"e\u0301"), 1)
+        self.assertEqual(util.display_width(u"a\u200bb"), 2)
+
+    def test_ansi(self):
+        self.assertEqual(util.display_width(util.colorize("Hello", "*red*")), 5)
+        self.assertEqual(util.display_width(util.colorize(u"\u6f22", "#ff8000")), 2)
+
+    def test_ljust(self):
+        self.assertEqual(util.ljust(u"\u6f22x", 5), u"\u6f22x  ")
+        self.assertEqual(util.ljust("abc", 2), "abc")
+
+
+class UtilTermWidthTest(unittest.TestCase):
+    def setUp(self):
+        util.invalidate_termwidth()
+
+    def tearDown(self):
+        util.invalidate_termwidth()
+
+    @patch.object(util, "_query_termwidth")
+    def test_termwidth_cached(self, query):
+        query.return_value = 120
+        self.assertEqual(util.termwidth(), 120)
+        self.assertEqual(util.termwidth(), 120)
+        query.assert_called_once_with()
+
+    @patch.object(util, "_query_termwidth")
+    def test_termwidth_invalidate(self, query):
+        query.return_value = 120
+        util.termwidth()
+        query.return_value = 100
+        util._sigwinch(signal.SIGWINCH, None)
+        self.assertEqual(util.termwidth(), 100)
+
+    @patch.dict(os.environ, {"COLUMNS": "132"})
+    @patch.object(sys, "stdin", StringIO.StringIO())
+    @patch.object(sys, "stdout", StringIO.StringIO())
+    @patch.object(sys, "stderr", StringIO.StringIO())
+    def test_termwidth_columns_fallback(self):
+        self.assertEqual(util.termwidth(), 132)
+
 
 class UtilColorizeTest(unittest.TestCase):
     def test_colorize_plain_black(self):
@@ -99,6 +198,28 @@ class UtilColorizeTest(unittest.TestCase):
     def test_colorize_strike_blue(self):
         self.assertEqual(util.colorize("Hello", "-blue-"), "\033[9m\033[34mHello\033[0m")
 
+    def test_colorize_none(self):
+        self.assertEqual(util.colorize("Hello", None), "Hello")
+
+    def test_colorize_256(self):
+        self.assertEqual(util.colorize("Hello", "208"), "\033[38;5;208mHello\033[0m")
+
+    def test_colorize_truecolor(self):
+        self.assertEqual(util.colorize("Hello", "*#ff8000*"), "\033[1m\033[38;2;255;128;0mHello\033[0m")
+
+    def test_colorize_unknown(self):
+        self.assertRaises(KeyError, util.colorize, "Hello", "mauve")
+        self.assertRaises(KeyError, util.colorize, "Hello", "256")
+        self.assertRaises(KeyError, util.colorize, "Hello", "#ff80zz")
+
+    def test_style_cached(self):
+        self.assertIs(util.style("*red*"), util.style("*red*"))
+        self.assertEqual(util.style("*red*"), ("\033[1m\033[31m", "\033[0m"))
+
+    def test_colorize_all(self):
+        self.assertEqual(util.colorize_all([("a", "red"), ("b", None), ("c", "_blue_")]),
+                         "\033[31ma\033[0mb\033[4m\033[34mc\033[0m")
+
 
 class UtilClassAccumulateList(unittest.TestCase):
     class Class0(object):